@@ -0,0 +1,220 @@
+import asyncio
+import bisect
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import zmq
+import zmq.asyncio
+
+from .node import Linker, NodeType
+from .placement import KeyPlacement, placement_from_info
+from .zmq_transport import decode_response, encode
+
+# Seconds an operation waits by default before raising asyncio.TimeoutError
+DEFAULT_TIMEOUT = 5.0
+# Operations sent and not answered yet, the next ones wait for a free slot
+MAX_IN_FLIGHT = 4096
+# Seconds the known chord nodes are trusted before asking the name server again
+RING_TTL = 10.0
+
+
+class AsyncDHTClient:
+    """
+    Asyncio client of the chord cache.
+
+    The client knows the chord nodes and their zmq endpoints, so every operation is
+    sent straight to the owner of the key over a persistent connection, without any
+    lookup in the ring. Only chord nodes created with the zmq transport can be used.
+
+        async with AsyncDHTClient(M) as client:
+            entries = await client.get_many(urls, timeout=1)
+    """
+
+    def __init__(
+        self,
+        m: int,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        ring_ttl: float = RING_TTL,
+    ) -> None:
+        self.m = m
+        self.MAX = 2 ** m
+        self.timeout = timeout
+        self.ring_ttl = ring_ttl
+        self.context = zmq.asyncio.Context()
+        self.sockets: Dict[str, zmq.asyncio.Socket] = {}
+        self.pending: Dict[bytes, asyncio.Future] = {}
+        self.readers: List[asyncio.Task] = []
+        self.linker: Optional[Linker] = None
+        # Sorted ids of the chord nodes and their endpoints
+        self.node_ids: List[int] = []
+        self.endpoints: Dict[int, str] = {}
+        self.placement = KeyPlacement(m)
+        self._ring_time = 0.0
+        # Held while the ring is refreshed, the operations that wait for it use the result
+        self._ring_lock = asyncio.Lock()
+        self._ids = itertools.count()
+        self._slots = asyncio.Semaphore(max_in_flight)
+        # The name server proxy is owned by a single thread
+        self._ns_executor = ThreadPoolExecutor(1)
+
+    async def __aenter__(self) -> "AsyncDHTClient":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def in_ns_thread(self, f: Callable[[], Any]) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._ns_executor, f)
+
+    async def connect(self):
+        self.linker = await self.in_ns_thread(lambda: Linker(self.m, transport="zmq"))
+        await self.refresh_ring()
+
+    async def close(self):
+        for task in self.readers:
+            task.cancel()
+        for sock in self.sockets.values():
+            sock.close(linger=0)
+        self.context.term()
+        self._ns_executor.shutdown()
+
+    ########
+    # Ring #
+    ########
+    def load_ring(self) -> Dict[int, str]:
+        endpoints = {}
+        for node_id in self.linker.get_nodes(NodeType.chord):
+            # Nodes may have been restarted on other endpoints
+            self.linker.forget_zmq_endpoint(node_id)
+            endpoint = self.linker.zmq_endpoint(node_id)
+            if endpoint is not None:
+                endpoints[node_id] = endpoint
+        return endpoints
+
+    def load_placement(self, node_id: int) -> KeyPlacement:
+        info = self.linker.get_node(NodeType.chord, node_id).placement
+        return placement_from_info(self.m, info)
+
+    async def refresh_ring(self):
+        self.endpoints = await self.in_ns_thread(self.load_ring)
+        if self.endpoints:
+            # Keys are placed as the ring does
+            self.placement = await self.in_ns_thread(
+                lambda: self.load_placement(next(iter(self.endpoints)))
+            )
+        self.node_ids = sorted(self.endpoints)
+        self._ring_time = time.time()
+
+    async def maybe_refresh_ring(self):
+        """
+        Refresh the ring once its ttl expired. The operations that need a refresh
+        while another one is running wait for it and use its result.
+        """
+        if self.node_ids and time.time() - self._ring_time < self.ring_ttl:
+            return
+        start = time.time()
+        async with self._ring_lock:
+            if self._ring_time < start:
+                await self.refresh_ring()
+
+    def hash(self, key: str) -> int:
+        return self.placement.position(key)
+
+    def owner(self, key: str) -> int:
+        """
+        Id of the first node at or after the key in the ring, as the chord nodes do
+        """
+        if not self.node_ids:
+            raise LookupError("There are no chord nodes with the zmq transport")
+        i = bisect.bisect_left(self.node_ids, self.hash(key))
+        return self.node_ids[i % len(self.node_ids)]
+
+    #########
+    # Calls #
+    #########
+    def socket(self, endpoint: str) -> zmq.asyncio.Socket:
+        if endpoint not in self.sockets:
+            sock = self.context.socket(zmq.DEALER)
+            sock.setsockopt(zmq.LINGER, 0)
+            sock.connect(endpoint)
+            self.sockets[endpoint] = sock
+            self.readers.append(asyncio.ensure_future(self.read(sock)))
+        return self.sockets[endpoint]
+
+    async def read(self, sock: zmq.asyncio.Socket):
+        while True:
+            request_id, payload = await sock.recv_multipart()
+            future = self.pending.pop(request_id, None)
+            # The future is missing if the operation expired
+            if future is not None and not future.done():
+                future.set_result(payload)
+
+    async def call(self, node_id: int, method: str, *args: Any, **kwargs: Any) -> Any:
+        request_id = next(self._ids).to_bytes(8, "little")
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            await self.socket(self.endpoints[node_id]).send_multipart(
+                [request_id, encode({"method": method, "args": args, "kwargs": kwargs})]
+            )
+            payload = await future
+        finally:
+            self.pending.pop(request_id, None)
+        # Nodes in the response are only needed by their id
+        return decode_response(payload, lambda x: x)
+
+    async def call_owner(self, key: str, method: str, *args: Any, timeout: Optional[float]):
+        """
+        Call the method of the key owner, the deadline includes the wait for a free slot.
+        The time left is sent as the budget of the operation, so the owner gives up
+        its hops once the caller stopped waiting.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.time() + timeout
+
+        async def call() -> Any:
+            async with self._slots:
+                await self.maybe_refresh_ring()
+                budget = max(0.0, deadline - time.time())
+                return await self.call(self.owner(key), method, key, *args, budget=budget)
+
+        try:
+            return await asyncio.wait_for(call(), timeout)
+        except asyncio.TimeoutError:
+            # The owner may have left the ring
+            self._ring_time = 0.0
+            raise
+
+    ##############
+    # Operations #
+    ##############
+    async def get(self, key: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Cache entry of the key as a dict, or None if the key is not cached
+        """
+        return await self.call_owner(key, "get", timeout=timeout)
+
+    async def insert(self, key: str, value: Dict[str, Any], timeout: Optional[float] = None):
+        await self.call_owner(key, "insert", value, timeout=timeout)
+
+    async def contains(self, key: str, timeout: Optional[float] = None) -> bool:
+        return await self.call_owner(key, "constains", timeout=timeout)
+
+    async def get_many(
+        self, keys: Iterable[str], timeout: Optional[float] = None
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Entries of the keys fetched concurrently, the keys that expire or fail are None
+        """
+        keys = list(keys)
+        results = await asyncio.gather(
+            *(self.get(key, timeout) for key in keys), return_exceptions=True
+        )
+        return {
+            key: None if isinstance(result, Exception) else result
+            for key, result in zip(keys, results)
+        }
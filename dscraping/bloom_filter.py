@@ -0,0 +1,223 @@
+import base64
+import hashlib
+import math
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from Pyro5.errors import PyroError
+
+from .node import Linker, NodeType
+
+FALSE_POSITIVE_RATE = 0.01
+# Seconds between two synchronizations of the peers key summaries
+SYNC_INTERVAL = 2.0
+
+
+class BloomFilter:
+    """
+    Bloom filter of the keys stored in a node.
+
+    The positions of the bits set since the filter was created are logged in order,
+    so peers can keep a copy up to date receiving only the bits they are missing.
+    A filter can not forget keys, it is replaced by a new epoch when rebuilt.
+    Bits are only set under a lock, so deltas never see a position logged twice.
+    """
+
+    def __init__(self, size: int, hashes: int, epoch: Optional[int] = None) -> None:
+        self.size = size
+        self.hashes = hashes
+        self.epoch = random.getrandbits(32) if epoch is None else epoch
+        self.bits = bytearray((size + 7) // 8)
+        self.log: List[int] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_capacity(
+        cls, capacity: int, false_positive_rate: float = FALSE_POSITIVE_RATE
+    ) -> "BloomFilter":
+        capacity = max(capacity, 1)
+        size = math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        hashes = max(1, round(size / capacity * math.log(2)))
+        return cls(size, hashes)
+
+    @property
+    def version(self) -> int:
+        return len(self.log)
+
+    def positions(self, key: str) -> List[int]:
+        digest = hashlib.md5(key.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def set_bit(self, position: int):
+        byte, bit = divmod(position, 8)
+        if not self.bits[byte] & (1 << bit):
+            self.bits[byte] |= 1 << bit
+            self.log.append(position)
+
+    def add(self, key: str):
+        positions = self.positions(key)
+        with self._lock:
+            for position in positions:
+                self.set_bit(position)
+
+    def delta(self, epoch: Optional[int], version: int) -> Dict[str, Any]:
+        """
+        Changes needed by a copy of the filter at the given epoch and version
+        """
+        with self._lock:
+            data = {
+                "epoch": self.epoch,
+                "version": self.version,
+                "size": self.size,
+                "hashes": self.hashes,
+            }
+            if epoch == self.epoch and version <= self.version:
+                data["positions"] = self.log[version:]
+            else:
+                data["bits"] = base64.b64encode(bytes(self.bits)).decode()
+        return data
+
+    @classmethod
+    def from_delta(cls, data: Dict[str, Any]) -> "BloomFilter":
+        bloom_filter = cls(data["size"], data["hashes"], data["epoch"])
+        bloom_filter.apply(data)
+        return bloom_filter
+
+    def apply(self, data: Dict[str, Any]):
+        with self._lock:
+            if "bits" in data:
+                self.bits = bytearray(base64.b64decode(data["bits"]))
+            else:
+                for position in data["positions"]:
+                    self.set_bit(position)
+            # Only the version matters for the copies, not the logged positions.
+            # Bits set by mark are not logged, the version is the one of the filter
+            self.log = [0] * data["version"]
+
+    def mark(self, key: str):
+        """
+        Set the bits of a key in a copy of the filter, without changing its version
+        """
+        positions = self.positions(key)
+        with self._lock:
+            for position in positions:
+                byte, bit = divmod(position, 8)
+                self.bits[byte] |= 1 << bit
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position // 8] & (1 << position % 8)
+            for position in self.positions(key)
+        )
+
+
+class KeySummaries:
+    """
+    Copies of the chord nodes key filters, used to detect definite cache misses
+    without any lookup in the ring.
+
+    The copies are pulled every sync_interval and the nodes push the keys they store
+    meanwhile to the nodes that pulled their filter, so a copy never misses a key
+    stored before the key is looked up. A node that joins the ring has no reader
+    to push its keys to, it makes every node forget its copy before storing any key.
+    A key is only ruled out while every node of the ring has a copy.
+    """
+
+    def __init__(
+        self,
+        linker: Linker,
+        local_id: Optional[int] = None,
+        sync_interval: float = SYNC_INTERVAL,
+    ) -> None:
+        self.linker = linker
+        # The node owning this summaries, its own filter is not copied
+        self.local_id = local_id
+        self.sync_interval = sync_interval
+        self.filters: Dict[int, BloomFilter] = {}
+        # Nodes of the ring without copy of their filter
+        self.missing: Set[int] = set()
+        # Keys pushed by every node while its filter is pulled, None out of a sync
+        self._pushed: Optional[Dict[int, List[str]]] = None
+        # Nodes forgotten while their filter is pulled
+        self._forgotten: Set[int] = set()
+        self._lock = threading.Lock()
+        self._sync_time = 0.0
+
+    def sync(self):
+        node_ids = self.linker.get_nodes(NodeType.chord) - {self.local_id}
+        with self._lock:
+            self._pushed = {node_id: [] for node_id in node_ids}
+            self._forgotten = set()
+
+        filters = {}
+        for node_id in node_ids:
+            current = self.filters.get(node_id)
+            try:
+                node = self.linker.get_node(NodeType.chord, node_id, self.local_id)
+                if current is None:
+                    data = node.key_summary_delta(None, 0, self.local_id)
+                else:
+                    data = node.key_summary_delta(
+                        current.epoch, current.version, self.local_id
+                    )
+            except PyroError:
+                continue
+
+            if current is None or current.epoch != data["epoch"]:
+                current = BloomFilter.from_delta(data)
+            else:
+                current.apply(data)
+            filters[node_id] = current
+
+        with self._lock:
+            # The keys pushed after a filter was pulled may be missing from it
+            for node_id, bloom_filter in filters.items():
+                for key in self._pushed[node_id]:
+                    bloom_filter.mark(key)
+            for node_id in self._forgotten:
+                filters.pop(node_id, None)
+            self.missing = set(self._pushed) - set(filters)
+            self.filters = filters
+            self._pushed = None
+        self._sync_time = time.time()
+
+    def add_keys(self, node_id: int, keys: List[str]):
+        """
+        Add the keys just stored by a node to the copy of its filter
+        """
+        with self._lock:
+            if self._pushed is not None:
+                self._pushed.setdefault(node_id, []).extend(keys)
+            current = self.filters.get(node_id)
+            if current is None:
+                # A node joined since the last sync, nothing rules out its keys
+                self.missing.add(node_id)
+                return
+            for key in keys:
+                current.mark(key)
+
+    def forget(self, node_id: int):
+        """
+        Drop the copy of the filter of a node that joined the ring,
+        its keys are not ruled out until the next sync pulls its filter
+        """
+        with self._lock:
+            self.filters.pop(node_id, None)
+            self.missing.add(node_id)
+            if self._pushed is not None:
+                self._pushed.setdefault(node_id, [])
+                self._forgotten.add(node_id)
+
+    def might_contain(self, key: str) -> bool:
+        """
+        Return False only if no node of the ring can have the key
+        """
+        with self._lock:
+            if not self._sync_time or self.missing:
+                # Nothing is known about the keys of some nodes
+                return True
+            return any(key in bloom_filter for bloom_filter in self.filters.values())
@@ -1,18 +1,53 @@
-import hashlib
+import math
 import random
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, List, Optional, Union
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 from Pyro5.api import Proxy, expose
-from Pyro5.errors import CommunicationError
+from Pyro5.errors import CommunicationError, PyroError
+from Pyro5.errors import TimeoutError as PyroTimeoutError
 
 from .node import Node, NodeType, Linker
+from .bloom_filter import SYNC_INTERVAL, KeySummaries
+from .failure_detector import HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, FailureDetector
 from .finger_table import FingerTable
-from .hash_table import HashTable
+from .frontier import Frontier
+from .hash_table import CacheEntry, HashTable
+from .latency import percentile
 from .monitoring import echo_error, monitor
+from .placement import url_host
+from .snapshot import (
+    SNAPSHOT_INTERVAL,
+    load_snapshot,
+    remove_snapshot,
+    save_snapshot,
+    snapshot_path,
+)
 
 USE_MONITOR = False
+# Nodes of a finger interval measured as alternates of the finger
+PNS_CANDIDATES = 3
+# Weight of the last measure in the round trip time moving average
+RTT_DECAY = 0.3
+# Next nodes in the ring known by every node, to replace a dead successor
+SUCCESSOR_LIST_SIZE = 3
+# Seconds a lookup hop waits for the answer of a node
+HOP_TIMEOUT = 2.0
+# Failed nodes a lookup routes around before giving up
+LOOKUP_RETRIES = 3
+# Seconds an operation has by default to complete, including all its hops
+OPERATION_BUDGET = 10.0
+# Hops slower than this percentile of the recent hops are hedged
+HEDGE_PERCENTILE = 0.95
+# Recent hop latencies kept, and needed before hedging
+HOP_WINDOW = 200
+MIN_HOP_SAMPLES = 20
+# Sync intervals without pulling the key filter after which a node is not pushed
+# the new keys anymore
+SUMMARY_READER_INTERVALS = 3
 
 
 @expose
@@ -28,6 +63,15 @@ class ChordNode(Node):
         use_stabilization: bool = True,
         stabilization_interval: int = 1000,
         fix_finger_interval: int = 1000,
+        summary_sync_interval: float = SYNC_INTERVAL,
+        snapshot_dir: Optional[str] = None,
+        snapshot_interval: float = SNAPSHOT_INTERVAL,
+        proximity_interval: float = 5,
+        use_proximity: bool = True,
+        successor_list_size: int = SUCCESSOR_LIST_SIZE,
+        heartbeat_interval: float = HEARTBEAT_INTERVAL,
+        operation_budget: float = OPERATION_BUDGET,
+        use_hedging: bool = False,
     ) -> None:
         self._id = id
         self.linker = linker
@@ -40,7 +84,44 @@ class ChordNode(Node):
         self.fixing_fingers_interval = fix_finger_interval
 
         self.hash_table = HashTable(cache_size)
-        self.executor = ThreadPoolExecutor()
+        self.hits = 0
+        self.misses = 0
+        self._lookups_lock = threading.Lock()
+        self.frontier = Frontier()
+        self.summaries = KeySummaries(linker, id, summary_sync_interval)
+        # Last time every node pulled the key filter of this node
+        self.summary_readers: Dict[int, float] = {}
+        self.publish_executor = ThreadPoolExecutor()
+
+        # Round trip time in seconds to other nodes
+        self.rtt: Dict[int, float] = {}
+        self.proximity_interval = proximity_interval
+        self.use_proximity = use_proximity
+
+        self.successor_list_size = successor_list_size
+        self._successors: List[int] = []
+        self.failure_detector = FailureDetector(expected_interval=heartbeat_interval)
+        self.heartbeat_interval = heartbeat_interval
+        # Persistent proxies of the monitored nodes, only used by the heartbeats
+        self._heartbeat_proxies: Dict[int, Proxy] = {}
+        self.heartbeat_executor = ThreadPoolExecutor(successor_list_size + linker.BITS_COUNT)
+
+        self.operation_budget = operation_budget
+        self.use_hedging = use_hedging
+        self.hop_latencies: deque = deque(maxlen=HOP_WINDOW)
+        self.hedged_hops = 0
+        self.hedge_executor = ThreadPoolExecutor()
+        # Ends the periodic tasks once the node left the ring, its process
+        # may keep serving other nodes
+        self.stopped = threading.Event()
+
+        self.snapshot_path = (
+            None if snapshot_dir is None else snapshot_path(snapshot_dir, id)
+        )
+        self.snapshot_interval = snapshot_interval
+        # Set when the cache was restored from a snapshot and still has to be
+        # reconciled with the successor
+        self.restored = False
 
     @property
     def id(self) -> int:
@@ -62,18 +143,75 @@ class ChordNode(Node):
     def serialized_hash_table_keys(self):
         return [s for s in self.hash_table]
 
+    @property
+    def dedup_stats(self) -> Dict[str, float]:
+        return self.hash_table.store.stats
+
+    @property
+    def frontier_size(self) -> int:
+        return len(self.frontier)
+
+    @property
+    def placement(self) -> Dict[str, Any]:
+        return self.linker.placement.info
+
+    @property
+    def finger_table_info(self) -> Dict[str, Any]:
+        """
+        Everything the finger-table command prints, in a single call
+        """
+        return {
+            "id": self.id,
+            "node_type": self.node_type,
+            "finger_table": self.serialized_finger_table,
+            "successors": self.successor_ids,
+            "suspected": self.suspected_nodes,
+        }
+
+    @property
+    def summary(self) -> Dict[str, Any]:
+        with self._lookups_lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        if self.predecessor_id is None:
+            ownership = None
+        else:
+            # A node owns the keys in the interval (predecessor, self.id]
+            ownership = ((self.id - self.predecessor_id - 1) % self.MAX + 1) / self.MAX
+        return {
+            "id": self.id,
+            "node_type": self.node_type,
+            **self.dedup_stats,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else None,
+            "ownership": ownership,
+            "frontier": self.frontier_size,
+        }
+
+    def hash_table_keys_page(self, cursor: Optional[str], limit: int) -> Dict[str, Any]:
+        """
+        Return at most limit keys in order after the cursor key, from the first one
+        if the cursor is None, and the cursor of the next page or None if there are
+        no more keys. Keys added or removed meanwhile do not shift the next pages.
+        """
+        keys = self.hash_table.keys_after(cursor, limit + 1)
+        more = len(keys) > limit
+        keys = keys[:limit]
+        return {"keys": keys, "next": keys[-1] if more else None}
+
     ###################################
     # Successor - Predecessor Section #
     ###################################
     @property
     def successor(self) -> Proxy:
         """Return the Proxy objecto to the successor node"""
-        return self.linker.get_node(self.node_type, self._ft[1].node)
+        return self.node(self._ft[1].node)
 
     @property
     def predecessor(self) -> Proxy:
         """Return the Proxy objecto to the predecessor node"""
-        return self.linker.get_node(self.node_type, self._ft[0].node)
+        return self.node(self._ft[0].node)
 
     @property
     def successor_id(self) -> Optional[int]:
@@ -84,10 +222,40 @@ class ChordNode(Node):
         return self._ft[0].node
 
     def set_successor(self, value: Optional[int]):
-        self._ft[1].node = value
+        self._ft[1] = value
 
     def set_predecessor(self, value: Optional[int]):
-        self._ft[0].node = value
+        self._ft[0] = value
+
+    @property
+    def successor_ids(self) -> List[int]:
+        """
+        The successor followed by the next nodes of the ring
+        """
+        return [self.successor_id, *self._successors]
+
+    def live_successor_id(self, avoid: Iterable[int] = ()) -> Optional[int]:
+        """
+        First node of the successor list that is not suspected to be dead
+        """
+        avoid = set(avoid)
+        for node_id in self.successor_ids:
+            if node_id == self.id or (
+                node_id not in avoid and not self.failure_detector.is_suspected(node_id)
+            ):
+                return node_id
+        return self.successor_id
+
+    def update_successor_list(self, successor_ids: List[int]):
+        """
+        Keep the successors of the successor, until the list wraps around to this node
+        """
+        successors = []
+        for node_id in successor_ids[: self.successor_list_size - 1]:
+            if node_id is None or node_id == self.id:
+                break
+            successors.append(node_id)
+        self._successors = successors
 
     #######
     # End #
@@ -97,7 +265,36 @@ class ChordNode(Node):
     # Utils #
     #########
     def hash(self, key: str) -> int:
-        return int(hashlib.md5(key.encode()).hexdigest(), base=16) % self.MAX
+        return self.linker.placement.position(key)
+
+    def node(self, node_id: int) -> Union["ChordNode", Proxy]:
+        if node_id == self.id:
+            return self
+        return self.linker.get_node(self.node_type, node_id, self.id)
+
+    def deadline(self, budget: Optional[float]) -> float:
+        return time.time() + (self.operation_budget if budget is None else budget)
+
+    def remaining(self, deadline: float) -> float:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise PyroTimeoutError("operation deadline exceeded")
+        return remaining
+
+    def node_until(self, node_id: int, deadline: float) -> Union["ChordNode", Proxy]:
+        """
+        Node whose calls fail when the deadline is exceeded
+        """
+        node = self.node(node_id)
+        if node is not self:
+            node._pyroTimeout = self.remaining(deadline)
+        return node
+
+    def might_contain(self, key: str) -> bool:
+        """
+        False if the key is not stored in any node, according to the key summaries
+        """
+        return key in self.hash_table.summary or self.summaries.might_contain(key)
 
     def in_between(self, k: int, a: int, b: int, equals: bool = True) -> bool:
         a %= self.MAX
@@ -116,45 +313,83 @@ class ChordNode(Node):
     ##################
     # Hash Table API #
     ##################
+    # Every operation takes the seconds it has left, the budget, and hands
+    # what remains of it to the owner of the key
+
     @monitor(active=USE_MONITOR)
-    def insert(self, key: str, value: str):
+    def insert(self, key: str, value: Dict[str, Any], budget: Optional[float] = None):
+        deadline = self.deadline(budget)
         hashed_key = self.hash(key)
         print(hashed_key)
-        node = self.find_successor(hashed_key)
-        if node.id == self.id:
-            self.hash_table[key] = value
+        node_id = self.find_successor_id(hashed_key, self.remaining(deadline))
+        if node_id == self.id:
+            self.hash_table[key] = CacheEntry.from_dict(value)
+            self.publish_keys([key], deadline)
         else:
-            node.insert(key, value)
+            self.node_until(node_id, deadline).insert(key, value, self.remaining(deadline))
 
     @monitor(active=USE_MONITOR)
-    def constains(self, key: str) -> bool:
+    def refresh(
+        self, key: str, metadata: Dict[str, Any], budget: Optional[float] = None
+    ) -> bool:
+        """
+        Update the fetch metadata of a cached key without transfering its body again
+        """
+        deadline = self.deadline(budget)
+        hashed_key = self.hash(key)
+        node_id = self.find_successor_id(hashed_key, self.remaining(deadline))
+        if node_id != self.id:
+            return self.node_until(node_id, deadline).refresh(
+                key, metadata, self.remaining(deadline)
+            )
+        return self.hash_table.refresh(key, **metadata)
+
+    @monitor(active=USE_MONITOR)
+    def constains(self, key: str, budget: Optional[float] = None) -> bool:
+        if not self.might_contain(key):
+            return False
+        deadline = self.deadline(budget)
         hashed_key = self.hash(key)
-        node = self.find_successor(hashed_key)
-        return (node.id == self.id and key in self.hash_table) or (
-            node.id != self.id and node.contains(key)
+        node_id = self.find_successor_id(hashed_key, self.remaining(deadline))
+        return (node_id == self.id and key in self.hash_table) or (
+            node_id != self.id
+            and self.node_until(node_id, deadline).constains(key, self.remaining(deadline))
         )
 
     @monitor(active=USE_MONITOR)
-    def get(self, key: str) -> Optional[str]:
+    def get(self, key: str, budget: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        if not self.might_contain(key):
+            return None
+        deadline = self.deadline(budget)
         hashed_key = self.hash(key)
-        node = self.find_successor(hashed_key)
-        if node.id == self.id:
-            return self.hash_table[key] if key in self.hash_table else None
+        node_id = self.find_successor_id(hashed_key, self.remaining(deadline))
+        if node_id == self.id:
+            # The key may be removed meanwhile, it is checked and read at once
+            entry = self.hash_table.get(key)
+            with self._lookups_lock:
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            return None if entry is None else entry.to_dict()
         else:
-            return node.get(key)
+            return self.node_until(node_id, deadline).get(key, self.remaining(deadline))
 
     @monitor(active=USE_MONITOR)
-    def pop_in_interval(self, start: int, end: int) -> Dict[str, str]:
+    def pop_in_interval(
+        self, start: int, end: int, known: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Dict[str, Any]]:
         """
         Pop keys of the cache hashed in interval [start, end]
+        The keys that the caller already has with the same digest, given in known,
+        are popped but not sent back
         """
 
-        data = {
-            x: self.hash_table[x]
-            for x in self.hash_table
-            if self.in_between(self.hash(x), start, end + 1)
-        }
-        self.hash_table.pop_many(data.keys())
+        def in_interval(key: str) -> bool:
+            return self.in_between(self.hash(key), start, end + 1)
+
+        data = self.hash_table.pop_where(in_interval, known)
+        data["frontier"] = self.frontier.export(in_interval)
         return data
 
     @monitor(active=USE_MONITOR)
@@ -166,12 +401,184 @@ class ChordNode(Node):
         if self.successor_id == self.id or self.predecessor_id is None:
             return
 
-        data = self.successor.pop_in_interval(self.predecessor_id + 1, self.id)
-        self.hash_table.update(data)
+        start = self.predecessor_id + 1
+        known = None
+        if self.restored:
+            known = self.hash_table.digests(
+                x for x in self.hash_table if self.in_between(self.hash(x), start, self.id + 1)
+            )
+        data = self.successor.pop_in_interval(start, self.id, known)
+        self.update_hash_table_with_keys(data)
+        self.restored = False
+
+    @monitor(active=USE_MONITOR)
+    def update_hash_table_with_keys(self, keys: Dict[str, Dict[str, Any]]):
+        self.hash_table.merge(keys)
+        self.publish_keys(list(keys["entries"]), self.deadline(None))
+        if "frontier" in keys:
+            self.frontier.merge(keys["frontier"])
+
+    @monitor(active=USE_MONITOR)
+    def key_summary_delta(
+        self, epoch: Optional[int], version: int, reader_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Changes of the key filter since the given version. The reader is registered
+        before the delta is taken, so every key missing from it is pushed later
+        """
+        if reader_id is not None:
+            self.summary_readers[reader_id] = time.time()
+        return self.hash_table.summary.delta(epoch, version)
+
+    @monitor(active=USE_MONITOR)
+    def add_summary_keys(self, node_id: int, keys: List[str]):
+        self.summaries.add_keys(node_id, keys)
+
+    @monitor(active=USE_MONITOR)
+    def forget_summary(self, node_id: int):
+        self.summaries.forget(node_id)
+
+    def announce(self):
+        """
+        Make every registered node forget its copy of the key filter of this node
+        before it stores any key, no node pulled the filter of a joining node yet
+        so its keys would be pushed to nobody
+        """
+        deadline = time.time() + HOP_TIMEOUT
+
+        def forget(node_id: int):
+            try:
+                self.node_until(node_id, deadline).forget_summary(self.id)
+            except PyroError as e:
+                echo_error(f"Node {node_id} not told to forget the key filter: {e}")
+
+        node_ids = self.linker.get_nodes(NodeType.chord) - {self.id}
+        list(self.publish_executor.map(forget, node_ids))
+
+    def publish_keys(self, keys: List[str], deadline: float):
+        """
+        Push the keys just stored to the nodes with a copy of the key filter, before
+        the operation returns, so no node rules them out until its next sync
+        """
+        if not keys:
+            return
+        expiry = time.time() - SUMMARY_READER_INTERVALS * self.summaries.sync_interval
+        readers = []
+        for node_id, pulled_at in list(self.summary_readers.items()):
+            if pulled_at < expiry:
+                self.summary_readers.pop(node_id, None)
+            elif not self.failure_detector.is_suspected(node_id):
+                readers.append(node_id)
+
+        def push(node_id: int):
+            try:
+                node = self.node_until(node_id, min(deadline, time.time() + HOP_TIMEOUT))
+                node.add_summary_keys(self.id, keys)
+            except PyroError as e:
+                echo_error(f"Keys not pushed to node {node_id}: {e}")
+
+        list(self.publish_executor.map(push, readers))
+
+    @monitor(active=USE_MONITOR)
+    def sync_summaries_subprocess(self):
+        while not self.stopped.is_set():
+            try:
+                self.summaries.sync()
+            except Exception as e:
+                echo_error(str(e))
+
+            self.stopped.wait(self.summaries.sync_interval)
+
+    #######
+    # End #
+    #######
+
+    ##########
+    # Domain #
+    ##########
+    @monitor(active=USE_MONITOR)
+    def host_entries(self, host: str) -> Dict[str, Any]:
+        """
+        Serialized entries of the cached pages of the host, as in HashTable.export,
+        and the successor of this node to continue along the arc of the host
+        """
+        # The substring test skips most keys without parsing them
+        keys = [x for x in self.hash_table if host in x and url_host(x) == host]
+        return {**self.hash_table.export(keys), "successor_id": self.live_successor_id()}
+
+    @monitor(active=USE_MONITOR)
+    def get_domain(
+        self, host: str, budget: Optional[float] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Cache entries of all the pages of the host by url.
+        The nodes owning the arc of the host are asked one after the other along the
+        ring, most hosts fit in one or two nodes with the host placement, while every
+        node is asked with the uniform placement.
+        """
+        deadline = self.deadline(budget)
+        start, end = self.linker.placement.host_arc(host)
+        first_id = node_id = self.find_successor_id(start, self.remaining(deadline))
+        position = start
+
+        pages = {}
+        while True:
+            if node_id == self.id:
+                data = self.host_entries(host)
+            else:
+                data = self.node_until(node_id, deadline).host_entries(host)
+            for url, entry in data["entries"].items():
+                pages[url] = {**entry, "body": data["bodies"].get(entry["digest"])}
+
+            # The node owns the positions of the arc up to its id
+            if self.in_between(end, position, node_id + 1):
+                break
+            position = node_id + 1
+            node_id = data["successor_id"]
+            if node_id == first_id:
+                break
+        return pages
+
+    #######
+    # End #
+    #######
+
+    ##################
+    # Crawl Frontier #
+    ##################
+    @monitor(active=USE_MONITOR)
+    def add_to_frontier(self, urls: List[str], depth: int) -> int:
+        """
+        Send each url to the frontier partition of the node owning its key,
+        with one call per owner node. Return the number of new urls queued.
+        """
+        batches: Dict[int, List[str]] = {}
+        owners: Dict[int, int] = {}
+        for url in urls:
+            hashed_key = self.hash(url)
+            if hashed_key not in owners:
+                owners[hashed_key] = self.find_successor_id(hashed_key)
+            batches.setdefault(owners[hashed_key], []).append(url)
+
+        count = 0
+        for node_id, batch in batches.items():
+            if node_id == self.id:
+                count += self.frontier.add(batch, depth)
+            else:
+                count += self.node(node_id).add_to_local_frontier(batch, depth)
+        return count
+
+    @monitor(active=USE_MONITOR)
+    def add_to_local_frontier(self, urls: List[str], depth: int) -> int:
+        return self.frontier.add(urls, depth)
+
+    @monitor(active=USE_MONITOR)
+    def take_from_frontier(self, n: int) -> List[Tuple[str, int]]:
+        return self.frontier.take(n)
 
     @monitor(active=USE_MONITOR)
-    def update_hash_table_with_keys(self, keys):
-        self.hash_table.update(keys)
+    def requeue_in_frontier(self, items: List[Tuple[str, int]]):
+        self.frontier.requeue(items)
 
     #######
     # End #
@@ -182,27 +589,336 @@ class ChordNode(Node):
     ##########################
     @monitor(active=USE_MONITOR)
     def find_successor(self, k: int) -> Union["ChordNode", Proxy]:
-        node = self.find_predecessor(k)
-        return node.successor
+        return self.node(self.find_successor_id(k))
+
+    @monitor(active=USE_MONITOR)
+    def find_successor_id(self, k: int, budget: Optional[float] = None) -> int:
+        predecessor_id = self.predecessor_id
+        if predecessor_id is not None and self.in_between(k, predecessor_id + 1, self.id + 1):
+            # The key is owned by this node, clients that resolve owners call it directly
+            return self.id
+        _, successor_id = self.find_predecessor_step(k, budget)
+        return successor_id
 
     @monitor(active=USE_MONITOR)
     def find_predecessor(self, key: int) -> Union["ChordNode", Proxy]:
-        node = self
+        predecessor_id, _ = self.find_predecessor_step(key)
+        return self.node(predecessor_id)
+
+    @monitor(active=USE_MONITOR)
+    def find_predecessor_step(self, key: int, budget: Optional[float] = None) -> Tuple[int, int]:
+        """
+        Return the ids of the predecessor and the successor of the key.
+        Every hop of the lookup is a single lookup_step call made from this node,
+        and the whole lookup must end within the budget.
+        A node that does not answer is suspected, and the previous node of the
+        lookup is asked again for a way around it.
+        """
+        deadline = self.deadline(budget)
+        avoid: List[int] = []
+        step = self.rank_step(self.lookup_step(key))
+        while step["next"] is not None and step["next"] != step["id"]:
+            try:
+                step = self.hop(step, key, avoid, deadline)
+            except PyroError:
+                if len(avoid) == LOOKUP_RETRIES or time.time() >= deadline:
+                    raise
+                self.failure_detector.fail(step["next"])
+                avoid.append(step["next"])
+                step = self.remote_lookup_step(step["id"], key, avoid, deadline)
+
+        return step["id"], step["successor_id"]
+
+    def remote_lookup_step(
+        self, node_id: int, key: int, avoid: List[int], deadline: float
+    ) -> Dict[str, Any]:
+        if node_id == self.id:
+            return self.rank_step(self.lookup_step(key, avoid))
+        node = self.node(node_id)
+        node._pyroTimeout = min(HOP_TIMEOUT, self.remaining(deadline))
+        start = time.time()
+        step = node.lookup_step(key, avoid)
+        self.hop_latencies.append(time.time() - start)
+        return self.rank_step(step)
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Seconds after which a hop is hedged, None until enough hops were measured
+        """
+        latencies = sorted(self.hop_latencies)
+        if len(latencies) < MIN_HOP_SAMPLES:
+            return None
+        return percentile(latencies, HEDGE_PERCENTILE)
+
+    def hop(
+        self, step: Dict[str, Any], key: int, avoid: List[int], deadline: float
+    ) -> Dict[str, Any]:
+        """
+        Ask the next node of the lookup for its step. With hedging, if it does not
+        answer within the hedge delay the same step is also asked to the next best
+        candidate, and the first answer is taken.
+        """
+        alternates = [
+            x for x in step.get("candidates", [])[1:] if x not in avoid and x != step["id"]
+        ]
+        delay = self.hedge_delay() if self.use_hedging and alternates else None
+        if delay is None:
+            return self.remote_lookup_step(step["next"], key, avoid, deadline)
+
+        futures = {
+            self.hedge_executor.submit(
+                self.remote_lookup_step, step["next"], key, avoid, deadline
+            ): step["next"]
+        }
+        done, _ = wait(futures, delay)
+        if not done:
+            self.hedged_hops += 1
+            hedge = self.hedge_executor.submit(
+                self.remote_lookup_step, alternates[0], key, avoid, deadline
+            )
+            futures[hedge] = alternates[0]
+
+        error: Optional[Exception] = None
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                node_id = futures.pop(future)
+                try:
+                    return future.result()
+                except PyroError as e:
+                    if time.time() < deadline:
+                        self.failure_detector.fail(node_id)
+                    error = e
+        raise error
 
-        while not self.in_between(key, node.id + 1, node.successor_id + 1):
-            node = node.closest_preceding_finger(key)
+    @monitor(active=USE_MONITOR)
+    def lookup_step(self, key: int, avoid: Iterable[int] = ()) -> Dict[str, Any]:
+        """
+        Return this node and its first live successor, and the candidates for the
+        next node of the lookup by finger interval if the key is not in the interval
+        (self.id, successor]. The node that started the lookup ranks them.
+        The nodes in avoid did not answer to the caller.
+        """
+        successor_id = self.live_successor_id(avoid)
+        if self.in_between(key, self.id + 1, successor_id + 1):
+            intervals = []
+        else:
+            intervals = self.preceding_intervals(key, avoid)
+        return {"id": self.id, "successor_id": successor_id, "intervals": intervals}
 
-        return node
+    def rank_step(self, step: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Add to a lookup step its candidates ranked by the round trip time from this
+        node, every hop of the lookup is a call from this node, and the next node
+        """
+        candidates = self.rank_candidates(step["intervals"])
+        step["candidates"] = candidates
+        step["next"] = candidates[0] if candidates else None
+        return step
 
     @monitor(active=USE_MONITOR)
     def closest_preceding_finger(self, key: int) -> Union["ChordNode", Proxy]:
+        return self.node(self.closest_preceding_finger_id(key))
+
+    @monitor(active=USE_MONITOR)
+    def closest_preceding_finger_id(self, key: int, avoid: Iterable[int] = ()) -> int:
+        """
+        Among the nodes of the highest finger interval that precede the key,
+        return the one with the lowest round trip time.
+        Suspected nodes and the nodes in avoid are skipped.
+        """
+        candidates = self.rank_candidates(self.preceding_intervals(key, avoid))
+        return candidates[0] if candidates else self.id
+
+    def preceding_intervals(self, key: int, avoid: Iterable[int] = ()) -> List[List[int]]:
+        """
+        Fingers and alternates that precede the key, by finger interval from the
+        highest one down, the finger first
+        """
+        ft = self.finger_table.snapshot()
+        avoid = set(avoid)
+
+        intervals = []
+        for i in range(self.BIT_COUNT, 0, -1):
+            interval = [
+                x
+                for x in dict.fromkeys([ft[i].node, *ft[i].alternates])
+                if x is not None
+                and self.in_between(x, self.id + 1, key)
+                and x not in avoid
+                and not self.failure_detector.is_suspected(x)
+            ]
+            if interval:
+                intervals.append(interval)
+        return intervals
+
+    def rank_candidates(self, intervals: List[List[int]]) -> List[int]:
+        """
+        Candidates from the highest finger interval down, and by round trip time
+        from this node within an interval. Without measures the finger is preferred.
+        """
+        candidates: Dict[int, None] = {}
+        for interval in intervals:
+            interval = [x for x in interval if not self.failure_detector.is_suspected(x)]
+            # The sort is stable, the nodes not measured keep the finger first
+            interval.sort(key=lambda x: self.rtt.get(x, math.inf))
+            candidates.update(dict.fromkeys(interval))
+        return list(candidates)
+
+    #######
+    # End #
+    #######
+
+    #############
+    # Proximity #
+    #############
+    @monitor(active=USE_MONITOR)
+    def ping(self) -> int:
+        return self.id
+
+    @monitor(active=USE_MONITOR)
+    def measure_rtt(self, node_id: int) -> Optional[float]:
+        try:
+            node = self.node(node_id)
+            node._pyroBind()
+            start = time.time()
+            node.ping()
+            rtt = time.time() - start
+        except PyroError:
+            self.rtt.pop(node_id, None)
+            return None
+
+        previous = self.rtt.get(node_id)
+        self.rtt[node_id] = rtt if previous is None else previous + RTT_DECAY * (rtt - previous)
+        return self.rtt[node_id]
+
+    @monitor(active=USE_MONITOR)
+    def update_proximity(self):
+        """
+        Measure the round trip time to the first nodes of every finger interval,
+        and keep them as alternates of the finger ordered by round trip time
+        """
+        alive_nodes = sorted(
+            self.linker.get_nodes(self.node_type) - {self.id},
+            key=lambda x: (x - self.id) % self.MAX,
+        )
         ft = self.finger_table
 
-        for i in range(self.linker.BITS_COUNT, 0, -1):
-            if ft[i].node is not None and self.in_between(ft[i].node, self.id + 1, key):
-                node = self.linker.get_node(self.node_type, self._ft[i].node)
-                return node
-        return self
+        for i in range(1, self.BIT_COUNT + 1):
+            end = ft[i + 1].start if i < self.BIT_COUNT else self.id
+            candidates = [
+                x for x in alive_nodes if self.in_between(x, ft[i].start, end, False)
+            ][:PNS_CANDIDATES]
+            for x in candidates:
+                self.measure_rtt(x)
+            self.finger_table.set_alternates(
+                i,
+                sorted((x for x in candidates if x in self.rtt), key=lambda x: self.rtt[x]),
+            )
+
+    @monitor(active=USE_MONITOR)
+    def proximity_subprocess(self):
+        while not self.stopped.is_set():
+            try:
+                self.update_proximity()
+            except Exception as e:
+                echo_error(str(e))
+
+            self.stopped.wait(self.proximity_interval)
+
+    #######
+    # End #
+    #######
+
+    #####################
+    # Failure Detection #
+    #####################
+    @property
+    def suspected_nodes(self) -> List[int]:
+        return sorted(self.failure_detector.suspected)
+
+    def monitored_nodes(self) -> Set[int]:
+        """
+        The predecessor, the successor list and the fingers, and the suspected
+        nodes still registered, so they are cleared when they answer again
+        """
+        ft = self.finger_table.snapshot()
+        nodes = {x.node for x in ft} | set(self.successor_ids)
+        suspected = self.failure_detector.suspected
+        if suspected:
+            nodes |= suspected & self.linker.get_nodes(self.node_type)
+        return nodes - {None, self.id}
+
+    def heartbeat(self, node_id: int) -> bool:
+        node = self._heartbeat_proxies.get(node_id)
+        try:
+            if node is None:
+                node = self.node(node_id)
+                node._pyroTimeout = HEARTBEAT_TIMEOUT
+                # A node of this process answers while it is registered,
+                # it is looked up again on every heartbeat
+                if self.linker.local_node(self.node_type, node_id) is None:
+                    self._heartbeat_proxies[node_id] = node
+            else:
+                # The proxy is used by a single heartbeat at a time, from any thread
+                node._pyroClaimOwnership()
+            node.ping()
+        except PyroError:
+            self._heartbeat_proxies.pop(node_id, None)
+            self.failure_detector.fail(node_id)
+            return False
+
+        self.failure_detector.heartbeat(node_id)
+        return True
+
+    @monitor(active=USE_MONITOR)
+    def detect_failures(self):
+        nodes = self.monitored_nodes()
+        for node_id in set(self._heartbeat_proxies) - nodes:
+            del self._heartbeat_proxies[node_id]
+        # Former fingers and successors, and the suspected nodes that left the ring
+        self.failure_detector.forget(self.failure_detector.nodes - nodes)
+        list(self.heartbeat_executor.map(self.heartbeat, nodes))
+
+        if self.failure_detector.is_suspected(self.predecessor_id):
+            self.set_predecessor(None)
+        if self.failure_detector.is_suspected(self.successor_id):
+            self.set_successor(self.live_successor_id())
+
+    @monitor(active=USE_MONITOR)
+    def failure_detector_subprocess(self):
+        while not self.stopped.is_set():
+            try:
+                self.detect_failures()
+            except Exception as e:
+                echo_error(str(e))
+
+            self.stopped.wait(self.heartbeat_interval)
+
+    #######
+    # End #
+    #######
+
+    ##############
+    # Benchmarks #
+    ##############
+    @monitor(active=USE_MONITOR)
+    def benchmark_lookups(self, count: int) -> Dict[str, Any]:
+        """
+        Return the latency in seconds of count lookups of random keys started in this
+        node, and the hops hedged meanwhile
+        """
+        hedged_hops = self.hedged_hops
+        latencies = []
+        for _ in range(count):
+            start = time.time()
+            self.find_successor_id(random.randrange(self.MAX))
+            latencies.append(time.time() - start)
+        return {
+            "latencies": latencies,
+            "hedging": self.use_hedging,
+            "hedged_hops": self.hedged_hops - hedged_hops,
+        }
 
     #######
     # End #
@@ -210,19 +926,36 @@ class ChordNode(Node):
 
     @monitor(active=USE_MONITOR)
     def join(self, anchor_node):
+        self.announce()
         if not self.use_stabilization and anchor_node is not None:
             self.init_finger_table(anchor_node)
             self.update_others()
             self.update_hash_table()
         elif self.use_stabilization:
             if anchor_node is not None:
-                for entry in self.finger_table:
-                    entry.node = None
-
-                self.set_successor(anchor_node.find_successor(self.id).id)
-
-            self.executor.submit(self.stabilize_subprocess)
-            self.executor.submit(self.fix_fingers_subprocess)
+                # Restored fingers are kept as hints until fix_fingers checks them
+                if not self.restored:
+                    for i in range(self.BIT_COUNT + 1):
+                        self.finger_table[i] = None
+
+                self.set_successor(anchor_node.find_successor_id(self.id))
+
+            self.start_subprocess(self.stabilize_subprocess)
+            self.start_subprocess(self.fix_fingers_subprocess)
+
+        self.start_subprocess(self.sync_summaries_subprocess)
+        if self.use_proximity:
+            self.start_subprocess(self.proximity_subprocess)
+        self.start_subprocess(self.failure_detector_subprocess)
+        if self.snapshot_path is not None:
+            self.start_subprocess(self.snapshot_subprocess)
+
+    def start_subprocess(self, target):
+        # Every periodic task never returns until the node stops, a shared pool
+        # smaller than the number of tasks would never run the last ones
+        threading.Thread(
+            target=target, name=f"{self.id}-{target.__name__}", daemon=True
+        ).start()
 
     ##############################
     # Join without stabilization #
@@ -232,15 +965,15 @@ class ChordNode(Node):
         ft = self.finger_table  # I do this so as not to write a lot
 
         successor = anchor_node.find_successor(ft[1].start)
-        ft[1].node = successor.id
-        ft[0].node = successor.predecessor_id
+        ft[1] = successor.id
+        ft[0] = successor.predecessor_id
         successor.set_predecessor(self.id)
 
         for i in range(1, self.linker.BITS_COUNT):
             if self.in_between(ft[i + 1].start, self.id, ft[i].node):
-                ft[i + 1].node = ft[i].node
+                ft[i + 1] = ft[i].node
             else:
-                succ = anchor_node.find_successor(ft[i + 1].start).id
+                succ = anchor_node.find_successor_id(ft[i + 1].start)
                 if self.in_between(self.id, ft[i + 1].start, succ, False):
                     ft[i + 1] = self.id
                 else:
@@ -257,7 +990,7 @@ class ChordNode(Node):
         ft = self.finger_table
 
         if self.in_between(new_id, self.id, ft[index].node):
-            ft[index].node = new_id
+            ft[index] = new_id
 
             # node with the "new_id" id is calling remote this node
             # and it finger table is computed correctly
@@ -277,7 +1010,7 @@ class ChordNode(Node):
     def stabilize_subprocess(self):
         interval = self.stabilization_interval
         interval_over_4 = interval // 4
-        while True:
+        while not self.stopped.is_set():
             waiting_time = random.randint(
                 interval - interval_over_4, interval + interval_over_4
             )  # milliseconds
@@ -285,20 +1018,29 @@ class ChordNode(Node):
             try:
                 self.stabilize()
             except Exception as e:
-                echo_error(e)
+                echo_error(str(e))
 
-            time.sleep(waiting_time / 1000)
+            self.stopped.wait(waiting_time / 1000)
 
     @monitor(active=USE_MONITOR)
     def stabilize(self):
-        node_id = self.successor.predecessor_id
+        # replace the successor if it is suspected to be dead
+        self.set_successor(self.live_successor_id())
+        try:
+            node_id = self.successor.predecessor_id
+            successor_ids = self.successor.successor_ids
+        except PyroError:
+            self.failure_detector.fail(self.successor_id)
+            raise
 
         # check if exists a better succesor
         if node_id is not None and self.in_between(
             node_id, self.id + 1, self.successor_id, equals=False
         ):
             self.set_successor(node_id)
+            successor_ids = self.successor.successor_ids
 
+        self.update_successor_list(successor_ids)
         self.successor.notify(self)
         self.update_hash_table()
 
@@ -322,23 +1064,73 @@ class ChordNode(Node):
     def fix_fingers_subprocess(self):
         interval = self.stabilization_interval
         interval_over_4 = interval // 4
-        while True:
+        while not self.stopped.is_set():
             waiting_time = random.randint(
                 interval - interval_over_4, interval + interval_over_4
             )  # milliseconds
             try:
                 self.fix_fingers()
             except Exception as e:
-                echo_error(e)
+                echo_error(str(e))
 
-            time.sleep(waiting_time / 1000)
+            self.stopped.wait(waiting_time / 1000)
 
     @monitor(active=USE_MONITOR)
     def fix_fingers(self):
         if self.BIT_COUNT < 2:
             return
         i = random.randint(2, self.BIT_COUNT)
-        self.finger_table[i].node = self.find_successor(self.finger_table[i].start).id
+        self.finger_table[i] = self.find_successor_id(self.finger_table[i].start)
+
+    #######
+    # End #
+    #######
+
+    ############
+    # Snapshot #
+    ############
+    @monitor(active=USE_MONITOR)
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "saved_at": time.time(),
+            "fingers": [[x.start, x.node] for x in self.finger_table],
+            "hash_table": self.hash_table.export(list(self.hash_table)),
+            "frontier": self.frontier.dump(),
+        }
+
+    @monitor(active=USE_MONITOR)
+    def snapshot_subprocess(self):
+        while not self.stopped.wait(self.snapshot_interval):
+            try:
+                save_snapshot(self.snapshot_path, self.snapshot())
+            except Exception as e:
+                echo_error(str(e))
+
+    @monitor(active=USE_MONITOR)
+    def restore(self) -> bool:
+        """
+        Load the cache, frontier and fingers of the last snapshot of this node.
+        Fingers to nodes that are not alive anymore are discarded.
+        """
+        if self.snapshot_path is None:
+            return False
+        data = load_snapshot(self.snapshot_path)
+        if data is None or data["id"] != self.id:
+            return False
+
+        self.hash_table.merge(data["hash_table"])
+        self.frontier.merge(data["frontier"])
+
+        alive_nodes = self.linker.get_nodes(self.node_type)
+        for i, (_, node) in enumerate(data["fingers"]):
+            alive = node in alive_nodes or node == self.id
+            self.finger_table[i] = node if alive else None
+        if self.successor_id is None:
+            self.set_successor(self.id)
+
+        self.restored = True
+        return True
 
     #######
     # End #
@@ -349,16 +1141,20 @@ class ChordNode(Node):
     #############
     @monitor(active=USE_MONITOR)
     def disconnect(self):
+        self.stopped.set()
         succ = self.successor
         pred = self.predecessor
         succ.set_predecessor(pred.id)
         pred.set_successor(succ.id)
-        succ.update_hash_table_with_keys(
-            {key: self.hash_table[key] for key in self.hash_table}
-        )
+        data = self.hash_table.export(self.hash_table)
+        data["frontier"] = self.frontier.export(lambda _: True)
+        succ.update_hash_table_with_keys(data)
 
         succ._pyroRelease()
         pred._pyroRelease()
+        if self.snapshot_path is not None:
+            # The keys were handed to the successor, they must not come back on restart
+            remove_snapshot(self.snapshot_path)
         self.linker.remove_node(self.node_type, self.id)
 
     #######
@@ -1,21 +1,57 @@
+import itertools
+import random
+import threading
 import time
-from multiprocessing import Process
-from typing import List, Optional
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 from Pyro5.api import expose
+from Pyro5.errors import PyroError
 
+from .hash_table import CacheEntry
+from .monitoring import echo_error
 from .node import Linker, Node, NodeType
+from .result_writer import ResultWriter
+from .router_selector import RouterSelector
+from .work_queue import Priority
+
+# Seconds a request waits for its response
+RESPONSE_TIMEOUT = 60
+# Seconds to wait before requesting again the urls rejected by busy routers
+RETRY_INTERVAL = 2
+# Requests waiting for their response, the next urls are read when one completes
+MAX_IN_FLIGHT = 256
+# Chord nodes tried by a cache operation before it fails
+CHORD_ATTEMPTS = 3
 
 
 @expose
 class ClientNode(Node):
     _node_type = NodeType.client
 
-    def __init__(self, linker: Linker, lines: List) -> None:
+    def __init__(
+        self,
+        linker: Linker,
+        lines: Iterable[str],
+        output: Optional[str] = None,
+        append: bool = False,
+        max_in_flight: int = MAX_IN_FLIGHT,
+    ) -> None:
         self.linker = linker
         self._id = self._find_id()
-        self._response = []
+        # The urls are read lazily, lines can be an open file
         self.lines = lines
+        self.output = output or f"output.client.{self._id}.jsonl"
+        self.append = append
+        self.max_in_flight = max_in_flight
+        self.router_selector = RouterSelector(linker)
+
+        # Responses of the requests sent to the routers, by request id
+        self._pending: Dict[int, Future] = {}
+        self._chunks: Dict[int, Dict[int, str]] = {}
+        self._request_ids = itertools.count()
+        self._lock = threading.Lock()
 
     @property
     def id(self):
@@ -25,77 +61,247 @@ class ClientNode(Node):
     def node_type(self):
         return self._id
 
-    @property
-    def response(self):
-        return self._response
-
-    def set_response(self, value):
-        self._response = value
-
     def _find_id(self) -> int:
         alive_nodes = self.linker.get_nodes(NodeType.client)
         max_id = max(alive_nodes) if alive_nodes else 0
         return max_id + 1
 
-    def find_router_node(self):
-        return self.linker.get_random_node(NodeType.router)
-
-    def wait_response(self):
-        timeout = 0
-        while not self.response:
-            time.sleep(1)
-            timeout += 1
-            if timeout == 60:
-                return None
-        return 0
-
-    def search_data(self, url: str) -> Optional[str]:
-        node = self.linker.get_random_node(NodeType.chord)
-        value = node.get(url)
-        if value is not None:
+    def find_router_node(self, url: str):
+        router_id = self.router_selector.select(url)
+        if router_id is None:
+            return None
+        return self.linker.get_node(NodeType.router, router_id)
+
+    def deliver(
+        self,
+        request_id: int,
+        index: int,
+        chunk: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        not_modified: bool = False,
+    ):
+        """
+        Receive a chunk of the body of a response, the last chunk carries the
+        fetch metadata and completes the request
+        """
+        with self._lock:
+            chunks = self._chunks.setdefault(request_id, {})
+            chunks[index] = chunk
+            if metadata is None:
+                return
+            del self._chunks[request_id]
+            future = self._pending.pop(request_id, None)
+
+        # The future is missing if the request expired
+        if future is not None:
+            body = None if not_modified else "".join(chunks[i] for i in sorted(chunks))
+            future.set_result({**metadata, "body": body})
+
+    def fail(self, request_id: int, message: str):
+        with self._lock:
+            self._chunks.pop(request_id, None)
+            future = self._pending.pop(request_id, None)
+        if future is not None:
+            future.set_exception(RuntimeError(message))
+
+    def request(self, url: str, saved_data: Optional[Dict[str, Any]]) -> Optional[Future]:
+        """
+        Request the url to a router and return the future of its response,
+        or None if no router can take it now
+        """
+        router_node = self.find_router_node(url)
+        if router_node is None:
+            return None
+
+        request_id = next(self._request_ids)
+        future: Future = Future()
+        # Registered before the request, the response may arrive before it returns
+        with self._lock:
+            self._pending[request_id] = future
+        validators = saved_data or {}
+        try:
+            op_code, _ = router_node.request_scrapping(
+                url,
+                self.id,
+                request_id,
+                Priority.normal,
+                validators.get("etag"),
+                validators.get("last_modified"),
+            )
+        except PyroError as e:
+            echo_error(str(e))
+            op_code = 1
+        if op_code != 0:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            return None
+
+        print(f"Url requested to node: {router_node.id} - {url}")
+        future.request_id = request_id
+        return future
+
+    def expire(self, future: Future):
+        with self._lock:
+            self._pending.pop(future.request_id, None)
+            self._chunks.pop(future.request_id, None)
+
+    def search_data(self, url: str) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """
+        Return (0, entry) if the url is cached and fresh, (2, entry) if the cached
+        entry is stale and must be revalidated and (1, None) if it is not cached
+        """
+        value = self.call_chord("get", url)
+        if value is None:
+            return 1, None
+        if CacheEntry.from_dict(value).is_fresh():
             return 0, value
-        return 1, None
+        return 2, value
 
-    def insert_data(self, url: str, data: str):
-        node = self.linker.get_random_node(NodeType.chord)
-        node.insert(url, data)
+    def insert_data(self, url: str, data: Dict[str, Any]):
+        self.call_chord("insert", url, data)
+
+    def refresh_data(self, url: str, metadata: Dict[str, Any]):
+        self.call_chord("refresh", url, metadata)
+
+    def call_chord(self, method: str, *args) -> Any:
+        """
+        Call the method on a random chord node, another one is tried when it fails,
+        a node that left the ring may still be registered
+        """
+        node_ids = list(self.linker.get_nodes(NodeType.chord))
+        if not node_ids:
+            raise LookupError("There are no chord nodes")
+        random.shuffle(node_ids)
+        for i, node_id in enumerate(node_ids[:CHORD_ATTEMPTS]):
+            try:
+                node = self.linker.get_node(NodeType.chord, node_id)
+                return getattr(node, method)(*args)
+            except PyroError as e:
+                if i == min(len(node_ids), CHORD_ATTEMPTS) - 1:
+                    raise
+                echo_error(f"node.{NodeType.chord.name}.{node_id} => {e}")
 
     def main_loop(self):
         try:
-            responses = []
-            processed_urls = []
-            while len(processed_urls) != len(self.lines):
-                for url in self.lines:
-                    if url in processed_urls:
-                        continue
-                    op_code, saved_data = self.search_data(url)
-                    if op_code == 1:
-                        router_node = self.find_router_node()
-                        if router_node is None:
-                            print(
-                                "The system is busy or unavailable, wait a few seconds and retry"
-                            )
-                            # give time to the system to recover
-                            time.sleep(2)
-                            continue
-                        print(f"Url requested to node: {router_node.id} - {url}")
-                        print("Waiting for response...")
-                        response = router_node.scrap(url)
-                        print(f"Recived response from node {router_node.id}")
-                        self.insert_data(url, response)
-                    else:
-                        response = saved_data
-                    responses.append(response)
-                    processed_urls.append(url)
-            file = open(f"output.client.{self.id}.txt", "w+")
-            file.writelines(list(map(lambda x: str(x), zip(processed_urls, responses))))
+            with ResultWriter(self.output, append=self.append) as writer:
+                self.resolve(writer)
             print("Done")
         except KeyboardInterrupt:
             return
 
+    def resolve(self, writer: ResultWriter):
+        """
+        Resolve the urls while they are read, with at most max_in_flight requests
+        waiting for their response, and write every result as soon as it is known.
+        An url repeated while its request is in flight is resolved once, and the urls
+        resolved by the records the writer appends to are skipped.
+        A failure of the cache or of the request is written as the result of its url.
+        """
+        urls = iter(self.lines)
+        exhausted = False
+        # url, cached data and request time of every request waiting for its response
+        pending: Dict[Future, Tuple[str, Optional[Dict[str, Any]], float]] = {}
+        in_flight: Set[str] = set()
+        rejected: List[str] = []
+        while not exhausted or rejected or pending:
+            # The rejected urls are requested again before reading new ones
+            waiting = deque(rejected)
+            rejected = []
+            while len(pending) + len(rejected) < self.max_in_flight:
+                if waiting:
+                    url = waiting.popleft()
+                else:
+                    url = next(urls, None)
+                    if url is None:
+                        exhausted = True
+                        break
+                if url in in_flight or url in writer.resolved:
+                    continue
+
+                try:
+                    op_code, saved_data = self.search_data(url)
+                except Exception as e:
+                    echo_error(f"Cache lookup of {url} failed: {e}")
+                    writer.write(url, None, str(e))
+                    continue
+                if op_code == 0:
+                    writer.write(url, saved_data["body"])
+                    continue
+                future = self.request(url, saved_data)
+                if future is None:
+                    rejected.append(url)
+                else:
+                    pending[future] = (url, saved_data, time.time())
+                    in_flight.add(url)
+            busy = bool(rejected)
+            # Not retried yet, the window is full
+            rejected.extend(waiting)
+
+            if busy:
+                print("The system is busy or unavailable, wait a few seconds and retry")
+                if not pending:
+                    # give time to the system to recover
+                    time.sleep(RETRY_INTERVAL)
+                    continue
+            if not pending:
+                continue
+
+            done, _ = wait(
+                pending,
+                timeout=RETRY_INTERVAL if rejected else RESPONSE_TIMEOUT,
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                url, saved_data, _ = pending.pop(future)
+                in_flight.discard(url)
+                try:
+                    self.complete(url, saved_data, future, writer)
+                except RuntimeError as e:
+                    echo_error(f"Request of {url} failed: {e}")
+                    writer.write(url, None, str(e))
+
+            now = time.time()
+            for future, (url, _, requested_at) in list(pending.items()):
+                if now - requested_at >= RESPONSE_TIMEOUT:
+                    echo_error(f"No response for {url}")
+                    self.expire(future)
+                    del pending[future]
+                    in_flight.discard(url)
+                    writer.write(url, None, "No response")
+
+    def complete(
+        self,
+        url: str,
+        saved_data: Optional[Dict[str, Any]],
+        future: Future,
+        writer: ResultWriter,
+    ):
+        """
+        Cache the response of a request and write the body of the url,
+        raise RuntimeError if the request failed.
+        The body is written even if it could not be cached, with the error.
+        """
+        data = future.result()
+
+        print(f"Recived response of {url}")
+        # Not modified, only the fetch metadata is updated
+        body = saved_data["body"] if data["body"] is None else data["body"]
+        try:
+            if data["body"] is None:
+                self.refresh_data(url, data)
+            else:
+                self.insert_data(url, data)
+        except Exception as e:
+            echo_error(f"Response of {url} not cached: {e}")
+            writer.write(url, body, f"Not cached: {e}")
+            return
+        writer.write(url, body)
+
     def start_loop(self):
-        p = Process(target=self.main_loop)
-        p.start()
-        self.linker.start_loop()
-        p.join()
-        self.linker.remove_node(self._node_type, self.id)
+        # The responses are delivered to the daemon of this process
+        thread = threading.Thread(target=self.main_loop, daemon=True)
+        thread.start()
+        try:
+            self.linker.start_loop()
+        finally:
+            self.linker.remove_node(self._node_type, self.id)
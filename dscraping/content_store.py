@@ -0,0 +1,79 @@
+import hashlib
+import threading
+from typing import Dict, Optional
+
+
+class ContentStore:
+    """
+    Page bodies stored once per content digest, with the number of keys referencing each one.
+    It is shared by all the stripes of a hash table, every operation holds its lock.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.bodies: Dict[str, str] = {}
+        self.refs: Dict[str, int] = {}
+        self.sizes: Dict[str, int] = {}
+
+    @staticmethod
+    def digest(body: str) -> str:
+        return hashlib.sha256(body.encode()).hexdigest()
+
+    def add(self, body: str, digest: Optional[str] = None) -> str:
+        """
+        Add a reference to the body and return its digest
+        """
+        if digest is None:
+            digest = self.digest(body)
+        with self._lock:
+            if digest not in self.bodies:
+                self.bodies[digest] = body
+                self.refs[digest] = 0
+                self.sizes[digest] = len(body.encode())
+            self.refs[digest] += 1
+        return digest
+
+    def acquire(self, digest: str):
+        with self._lock:
+            self.refs[digest] += 1
+
+    def release(self, digest: str):
+        with self._lock:
+            self.refs[digest] -= 1
+            if self.refs[digest] == 0:
+                del self.bodies[digest]
+                del self.refs[digest]
+                del self.sizes[digest]
+
+    @property
+    def physical_bytes(self) -> int:
+        with self._lock:
+            return sum(self.sizes.values())
+
+    @property
+    def logical_bytes(self) -> int:
+        with self._lock:
+            return sum(self.sizes[d] * self.refs[d] for d in self.bodies)
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            physical_bytes = sum(self.sizes.values())
+            logical_bytes = sum(self.sizes[d] * self.refs[d] for d in self.bodies)
+            bodies = len(self.bodies)
+            references = sum(self.refs.values())
+        return {
+            "bodies": bodies,
+            "references": references,
+            "logical_bytes": logical_bytes,
+            "physical_bytes": physical_bytes,
+            "dedup_ratio": logical_bytes / physical_bytes if physical_bytes else 1.0,
+        }
+
+    def __getitem__(self, digest: str) -> str:
+        with self._lock:
+            return self.bodies[digest]
+
+    def __contains__(self, digest: str) -> bool:
+        with self._lock:
+            return digest in self.bodies
@@ -0,0 +1,46 @@
+import json
+from typing import Any, Dict, List
+from urllib.parse import urldefrag, urljoin, urlsplit
+
+from bs4 import BeautifulSoup
+
+IGNORED_TAGS = ["script", "style", "noscript", "template"]
+
+
+def extract_links(soup: BeautifulSoup, url: str) -> List[str]:
+    """
+    Absolute http(s) urls of the page anchors, without fragments or repetitions
+    """
+    links = {}
+    for anchor in soup.find_all("a", href=True):
+        link, _ = urldefrag(urljoin(url, anchor["href"]))
+        if urlsplit(link).scheme in ("http", "https"):
+            links[link] = None
+    return list(links)
+
+
+def extract_page_links(html: str, url: str) -> List[str]:
+    return extract_links(BeautifulSoup(html, "html.parser"), url)
+
+
+def extract_document(html: str, url: str) -> Dict[str, Any]:
+    soup = BeautifulSoup(html, "html.parser")
+    links = extract_links(soup, url)
+
+    for tag in soup(IGNORED_TAGS):
+        tag.decompose()
+    title = soup.title.get_text(strip=True) if soup.title is not None else None
+    text = " ".join(soup.get_text(" ").split())
+
+    return {"title": title, "text": text, "links": links}
+
+
+def serialize_document(document: Dict[str, Any]) -> str:
+    return json.dumps(document, ensure_ascii=False, separators=(",", ":"))
+
+
+def extract(html: str, url: str) -> str:
+    """
+    Parse the page and return its compact document serialized, ready to be cached
+    """
+    return serialize_document(extract_document(html, url))
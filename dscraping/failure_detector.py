@@ -0,0 +1,94 @@
+import math
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, Optional, Set
+
+# Seconds between two heartbeats to every monitored node
+HEARTBEAT_INTERVAL = 0.5
+# Seconds a heartbeat waits for the answer, a late answer counts as missed
+HEARTBEAT_TIMEOUT = 0.5
+# Suspicion level above which a silent node is suspected
+PHI_THRESHOLD = 5.0
+# Intervals between heartbeats kept per node to estimate the next one
+WINDOW_SIZE = 100
+
+
+class FailureDetector:
+    """
+    Phi accrual failure detector fed with heartbeats.
+
+    The suspicion level of a node grows with the time since its last heartbeat,
+    relative to the mean interval between its heartbeats:
+        phi = -log10(P(interval > elapsed)) = elapsed / mean * log10(e)
+    assuming exponentially distributed intervals. A node is suspected once phi
+    crosses the threshold, or right away if a heartbeat to it failed.
+    """
+
+    def __init__(
+        self,
+        threshold: float = PHI_THRESHOLD,
+        window_size: int = WINDOW_SIZE,
+        expected_interval: float = HEARTBEAT_INTERVAL,
+    ) -> None:
+        self.threshold = threshold
+        self.window_size = window_size
+        self.expected_interval = expected_interval
+        self.intervals: Dict[int, Deque[float]] = {}
+        self.last_heartbeat: Dict[int, float] = {}
+        self.failed: Set[int] = set()
+        self._lock = threading.Lock()
+
+    def heartbeat(self, node_id: int, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            last = self.last_heartbeat.get(node_id)
+            if last is not None:
+                intervals = self.intervals.setdefault(node_id, deque(maxlen=self.window_size))
+                intervals.append(now - last)
+            self.last_heartbeat[node_id] = now
+            self.failed.discard(node_id)
+
+    def fail(self, node_id: int):
+        """
+        Suspect the node until its next heartbeat, a call to it failed
+        """
+        with self._lock:
+            self.failed.add(node_id)
+
+    def phi(self, node_id: int, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        with self._lock:
+            last = self.last_heartbeat.get(node_id)
+            if last is None:
+                return 0.0
+            intervals = self.intervals.get(node_id)
+            mean = sum(intervals) / len(intervals) if intervals else self.expected_interval
+        return (now - last) / max(mean, 1e-6) * math.log10(math.e)
+
+    def is_suspected(self, node_id: Optional[int]) -> bool:
+        if node_id is None:
+            return False
+        return node_id in self.failed or self.phi(node_id) > self.threshold
+
+    @property
+    def nodes(self) -> Set[int]:
+        """
+        Nodes with a heartbeat or a failure recorded
+        """
+        with self._lock:
+            return set(self.failed) | set(self.last_heartbeat)
+
+    @property
+    def suspected(self) -> Set[int]:
+        return {x for x in self.nodes if self.is_suspected(x)}
+
+    def forget(self, node_ids: Iterable[int]):
+        """
+        Drop the history of nodes not monitored anymore
+        """
+        with self._lock:
+            for node_id in node_ids:
+                self.intervals.pop(node_id, None)
+                self.last_heartbeat.pop(node_id, None)
+                self.failed.discard(node_id)
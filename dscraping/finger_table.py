@@ -1,34 +1,58 @@
 import dataclasses
-from typing import Iterable, List, Optional
+import threading
+from typing import Iterable, List, Optional, Tuple
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class FingerData:
     start: int
     node: Optional[int]
+    # Other nodes in the finger interval, ordered by round trip time
+    alternates: Tuple[int, ...] = ()
 
 
 class FingerTable:
+    """
+    Finger table shared by the threads of a chord node.
+
+    Entries are immutable and the table is an immutable tuple swapped on every change,
+    so readers never lock and a snapshot is always consistent.
+    """
+
     def __init__(self, node_id: int, size: int) -> None:
         self.node_id: int = node_id
         self.size: int = size
+        self._lock = threading.Lock()
 
         # FingerTable[0].node is the predecessor node in the chord cycle
-        self.ft: List[FingerData] = [FingerData(node_id, node_id)] + [
-            FingerData(self.start_index(i), node_id) for i in range(1, size + 1)
-        ]
+        self.ft: Tuple[FingerData, ...] = tuple(
+            [FingerData(node_id, node_id)]
+            + [FingerData(self.start_index(i), node_id) for i in range(1, size + 1)]
+        )
 
     def start_index(self, i: int) -> int:
         return (self.node_id + 2 ** (i - 1)) % 2 ** self.size
 
+    def snapshot(self) -> Tuple[FingerData, ...]:
+        return self.ft
+
+    def update(self, key: int, **changes):
+        with self._lock:
+            ft = list(self.ft)
+            ft[key] = dataclasses.replace(ft[key], **changes)
+            self.ft = tuple(ft)
+
     def __getitem__(self, key: int) -> FingerData:
         return self.ft[key]
 
     def __setitem__(self, key: int, node: Optional[int]) -> None:
-        self.ft[key].node = node
+        self.update(key, node=node)
+
+    def set_alternates(self, key: int, alternates: List[int]):
+        self.update(key, alternates=tuple(alternates))
 
     def __iter__(self) -> Iterable[FingerData]:
         yield from self.ft
 
     def __str__(self) -> str:
-        return f"Finger Table of {self.node_id}\n" + "\n".join(self.ft)
+        return f"Finger Table of {self.node_id}\n" + "\n".join(str(x) for x in self.ft)
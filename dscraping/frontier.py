@@ -0,0 +1,88 @@
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Set, Tuple
+
+
+class Frontier:
+    """
+    Partition of the crawl frontier owned by a chord node.
+
+    Every pending url has a depth, the number of link levels that are still followed
+    from it. Deeper urls are served first so the crawl advances breadth first.
+    The node serves many requests at once, every method holds the frontier lock.
+    """
+
+    def __init__(self) -> None:
+        self.levels: Dict[int, Deque[str]] = {}
+        self.seen: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def add(self, urls: Iterable[str], depth: int) -> int:
+        """
+        Queue the urls never seen before and return how many were queued
+        """
+        with self._lock:
+            count = 0
+            for url in urls:
+                if url in self.seen:
+                    continue
+                self.seen.add(url)
+                self.levels.setdefault(depth, deque()).append(url)
+                count += 1
+            return count
+
+    def requeue(self, items: Iterable[Tuple[str, int]]):
+        """
+        Put back taken urls that could not be crawled
+        """
+        with self._lock:
+            for url, depth in items:
+                self.levels.setdefault(depth, deque()).appendleft(url)
+
+    def take(self, n: int) -> List[Tuple[str, int]]:
+        with self._lock:
+            items = []
+            for depth in sorted(self.levels, reverse=True):
+                level = self.levels[depth]
+                while level and len(items) < n:
+                    items.append((level.popleft(), depth))
+                if not level:
+                    del self.levels[depth]
+                if len(items) == n:
+                    break
+            return items
+
+    def export(self, predicate: Callable[[str], bool]) -> Dict[str, list]:
+        """
+        Remove and serialize the seen and pending urls that satisfy the predicate
+        """
+        with self._lock:
+            seen = [url for url in self.seen if predicate(url)]
+            self.seen.difference_update(seen)
+
+            pending = []
+            for depth in list(self.levels):
+                level = self.levels[depth]
+                pending.extend((url, depth) for url in level if predicate(url))
+                self.levels[depth] = deque(url for url in level if not predicate(url))
+                if not self.levels[depth]:
+                    del self.levels[depth]
+            return {"seen": seen, "pending": pending}
+
+    def dump(self) -> Dict[str, list]:
+        """
+        Serialize the seen and pending urls without removing them
+        """
+        with self._lock:
+            pending = [(url, depth) for depth, level in self.levels.items() for url in level]
+            return {"seen": list(self.seen), "pending": pending}
+
+    def merge(self, data: Dict[str, list]):
+        with self._lock:
+            self.seen.update(data["seen"])
+            for url, depth in data["pending"]:
+                self.levels.setdefault(depth, deque()).append(url)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(level) for level in self.levels.values())
@@ -1,34 +1,337 @@
-from typing import Dict, Iterable, Union
+import bisect
+import contextlib
+import dataclasses
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
 from collections import OrderedDict
 
+from .bloom_filter import BloomFilter
+from .content_store import ContentStore
+
+# Number of independently locked parts of a hash table
+STRIPES = 16
+# Small tables use less stripes, a full stripe evicts while others have room
+MIN_STRIPE_SIZE = 64
+
+
+@dataclasses.dataclass
+class CacheEntry:
+    body: Optional[str]
+    fetched_at: float
+    # "html" for raw pages, "document" for the json of the extracted page
+    kind: Optional[str] = "html"
+    ttl: Optional[float] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    digest: Optional[str] = None
+
+    @property
+    def expires_at(self) -> Optional[float]:
+        return None if self.ttl is None else self.fetched_at + self.ttl
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        if self.ttl is None:
+            return True
+        return (time.time() if now is None else now) < self.expires_at
+
+    def refresh(
+        self,
+        fetched_at: float,
+        ttl: Optional[float] = None,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        **kwargs,
+    ):
+        """
+        Update the fetch metadata after the origin confirmed that the body did not change
+        """
+        self.fetched_at = fetched_at
+        self.ttl = ttl
+        self.etag = etag or self.etag
+        self.last_modified = last_modified or self.last_modified
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dataclasses.asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CacheEntry":
+        fields = {f.name for f in dataclasses.fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in fields})
+
 
 class HashTable:
-    def __init__(self, max_size: int) -> None:
-        self.dict: OrderedDict[str, str] = OrderedDict()
+    """
+    Cache entries by key. The entries only keep the digest of their body,
+    the bodies are stored once in a content store shared by all the keys.
+    The keys are summarized in a bloom filter, rebuilt after max_size removals.
+
+    The keys are split in stripes, each with its own lock and its own share of
+    max_size, so concurrent requests only wait for the requests of the same stripe.
+    Entries are evicted in insertion order within their stripe.
+    Every stripe also keeps its keys sorted, to page the keys without a full scan.
+    """
+
+    def __init__(self, max_size: int, stripes: int = STRIPES) -> None:
+        self.store = ContentStore()
         self.__max_size: int = max_size
+        stripes = max(1, min(stripes, max_size // MIN_STRIPE_SIZE))
+        self.stripes: List[OrderedDict[str, CacheEntry]] = [
+            OrderedDict() for _ in range(stripes)
+        ]
+        self.sorted_keys: List[List[str]] = [[] for _ in range(stripes)]
+        self.locks = [threading.RLock() for _ in range(stripes)]
+        # Capacity of every stripe, they add up to max_size
+        self.capacities = [
+            max_size // stripes + (i < max_size % stripes) for i in range(stripes)
+        ]
+        self.summary = BloomFilter.for_capacity(max_size)
+        self._removed = 0
+        self._removed_lock = threading.Lock()
+
+    def stripe(self, key: str) -> int:
+        return hash(key) % len(self.stripes)
+
+    @contextlib.contextmanager
+    def locked(self, key: str) -> Iterator[OrderedDict]:
+        i = self.stripe(key)
+        with self.locks[i]:
+            yield self.stripes[i]
 
-    def update(self, other: Union["HashTable", Dict[str, str]]):
-        if isinstance(other, (HashTable, dict, OrderedDict)):
+    @contextlib.contextmanager
+    def locked_all(self) -> Iterator[None]:
+        with contextlib.ExitStack() as stack:
+            for lock in self.locks:
+                stack.enter_context(lock)
+            yield
+
+    @property
+    def dict(self) -> Dict[str, CacheEntry]:
+        """
+        Copy of all the entries, without bodies
+        """
+        entries = {}
+        for lock, stripe in zip(self.locks, self.stripes):
+            with lock:
+                entries.update(stripe)
+        return entries
+
+    def update(self, other: Union["HashTable", Dict[str, CacheEntry]]):
+        if isinstance(other, HashTable):
+            for key in other:
+                self[key] = other.entry(key)
+        elif isinstance(other, (dict, OrderedDict)):
             for key in other:
                 self[key] = other[key]
 
+    def entry(self, key: str) -> CacheEntry:
+        """
+        Return a copy of the entry with its body
+        """
+        with self.locked(key) as stripe:
+            entry = stripe[key]
+            return dataclasses.replace(entry, body=self.store[entry.digest])
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """
+        Return a copy of the entry with its body, or None if the key is missing
+        """
+        with self.locked(key) as stripe:
+            if key not in stripe:
+                return None
+            entry = stripe[key]
+            return dataclasses.replace(entry, body=self.store[entry.digest])
+
+    def refresh(self, key: str, **metadata) -> bool:
+        """
+        Update the fetch metadata of the entry, return False if the key is missing.
+        The entry is replaced by an updated copy, readers may still hold the old one.
+        """
+        with self.locked(key) as stripe:
+            if key not in stripe:
+                return False
+            entry = dataclasses.replace(stripe[key])
+            entry.refresh(**metadata)
+            stripe[key] = entry
+            return True
+
+    def export(
+        self, keys: Iterable[str], known_digests: Iterable[str] = ()
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Serialize the entries of the keys, each distinct body is included only once
+        and only if its digest is not known by the receiver.
+        Keys removed meanwhile are skipped.
+        """
+        known_digests = set(known_digests)
+        entries = {}
+        bodies = {}
+        for key in keys:
+            with self.locked(key) as stripe:
+                if key not in stripe:
+                    continue
+                entry = stripe[key]
+                entries[key] = entry.to_dict()
+                if entry.digest not in known_digests and entry.digest not in bodies:
+                    bodies[entry.digest] = self.store[entry.digest]
+        return {"entries": entries, "bodies": bodies}
+
+    def pop_where(
+        self, predicate: Callable[[str], bool], known: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Remove and serialize the entries of the keys that satisfy the predicate.
+        The keys given in known with the same digest are removed but not serialized,
+        and the bodies of their digests are not included.
+        """
+        known = known or {}
+        known_digests = set(known.values())
+        entries = {}
+        bodies = {}
+        for i, (lock, stripe) in enumerate(zip(self.locks, self.stripes)):
+            with lock:
+                for key in [x for x in stripe if predicate(x)]:
+                    entry = stripe[key]
+                    if known.get(key) != entry.digest:
+                        entries[key] = entry.to_dict()
+                        if entry.digest not in known_digests and entry.digest not in bodies:
+                            bodies[entry.digest] = self.store[entry.digest]
+                    self.store.release(stripe.pop(key).digest)
+                    self.count_removed()
+                self.sorted_keys[i] = [x for x in self.sorted_keys[i] if x in stripe]
+        self.maybe_rebuild_summary()
+        return {"entries": entries, "bodies": bodies}
+
+    def merge(self, data: Dict[str, Dict[str, Any]]):
+        """
+        Add the entries serialized with export, the bodies not included
+        must be already in the content store.
+
+        Every incoming body is referenced before any entry is replaced, the entry
+        replaced by one key may hold the last reference to the body of another key.
+        """
+        bodies = data["bodies"]
+        entries = {}
+        for key, value in data["entries"].items():
+            entry = CacheEntry.from_dict(value)
+            entry.body = bodies.get(entry.digest)
+            entries[key] = entry
+
+        pinned = []
+        try:
+            for digest in {entry.digest for entry in entries.values()}:
+                if digest in bodies:
+                    self.store.add(bodies[digest], digest)
+                else:
+                    self.store.acquire(digest)
+                pinned.append(digest)
+            for key, entry in entries.items():
+                self[key] = entry
+        finally:
+            for digest in pinned:
+                self.store.release(digest)
+
+    def digests(self, keys: Iterable[str]) -> Dict[str, str]:
+        digests = {}
+        for key in keys:
+            with self.locked(key) as stripe:
+                if key in stripe:
+                    digests[key] = stripe[key].digest
+        return digests
+
+    def count_removed(self):
+        with self._removed_lock:
+            self._removed += 1
+
+    def maybe_rebuild_summary(self):
+        # Called without any stripe lock held, rebuild_summary takes all of them
+        if self._removed >= self.__max_size:
+            self.rebuild_summary()
+
+    def remove_sorted(self, i: int, key: str):
+        keys = self.sorted_keys[i]
+        del keys[bisect.bisect_left(keys, key)]
+
     def pop(self, key: str):
-        del self.dict[key]
+        i = self.stripe(key)
+        with self.locks[i]:
+            self.store.release(self.stripes[i].pop(key).digest)
+            self.remove_sorted(i, key)
+        self.count_removed()
+        self.maybe_rebuild_summary()
+
+    def rebuild_summary(self):
+        # No key can be added while the new filter is built, it would be missing
+        with self.locked_all():
+            summary = BloomFilter.for_capacity(self.__max_size)
+            for stripe in self.stripes:
+                for key in stripe:
+                    summary.add(key)
+            self.summary = summary
+            with self._removed_lock:
+                self._removed = 0
 
     def pop_many(self, keys: Iterable[str]):
         for k in keys:
             self.pop(k)
 
-    def __getitem__(self, key: str) -> str:
-        return self.dict[key]
+    def __getitem__(self, key: str) -> CacheEntry:
+        with self.locked(key) as stripe:
+            return stripe[key]
 
-    def __setitem__(self, key, value):
-        if len(self.dict) == self.__max_size:
-            self.dict.popitem(last=False)
-        self.dict[key] = value
+    def __setitem__(self, key: str, value: CacheEntry):
+        i = self.stripe(key)
+        evicted = False
+        with self.locks[i]:
+            stripe = self.stripes[i]
+            # Reference the new body before releasing the old one, they may be the same
+            if value.body is None:
+                self.store.acquire(value.digest)
+                digest = value.digest
+            else:
+                digest = self.store.add(value.body, value.digest)
+
+            if key in stripe:
+                self.store.release(stripe.pop(key).digest)
+                evicted = True
+            else:
+                if len(stripe) >= self.capacities[i]:
+                    old_key, old_entry = stripe.popitem(last=False)
+                    self.store.release(old_entry.digest)
+                    self.remove_sorted(i, old_key)
+                    evicted = True
+                bisect.insort(self.sorted_keys[i], key)
+            stripe[key] = dataclasses.replace(value, body=None, digest=digest)
+            self.summary.add(key)
+
+        if evicted:
+            self.count_removed()
+            self.maybe_rebuild_summary()
 
     def __contains__(self, key: str) -> bool:
-        return key in self.dict
+        with self.locked(key) as stripe:
+            return key in stripe
+
+    def __len__(self) -> int:
+        return sum(len(stripe) for stripe in self.stripes)
+
+    def keys_after(self, cursor: Optional[str], limit: int) -> List[str]:
+        """
+        Return at most limit keys in order after the cursor key,
+        from the first one if the cursor is None
+        """
+        keys = []
+        for lock, sorted_keys in zip(self.locks, self.sorted_keys):
+            with lock:
+                start = 0 if cursor is None else bisect.bisect_right(sorted_keys, cursor)
+                keys.append(sorted_keys[start : start + limit])
+        return list(itertools.islice(heapq.merge(*keys), limit))
 
     def __iter__(self):
-        yield from self.dict
+        for lock, stripe in zip(self.locks, self.stripes):
+            # Iterate over a copy, other threads may change the stripe meanwhile
+            with lock:
+                keys = list(stripe)
+            yield from keys
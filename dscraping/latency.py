@@ -0,0 +1,85 @@
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+
+from Pyro5.api import Proxy
+
+
+def percentile(latencies: List[float], p: float) -> float:
+    """
+    Nearest rank p percentile, from 0 to 1, of latencies sorted in increasing order
+    """
+    return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+
+class LinkLatency:
+    """
+    Synthetic round trip times between nodes, to benchmark a local multi-node setup
+    as if the nodes were spread across racks.
+
+    The latency file is a json object like:
+        {
+            "racks": {"0": "a", "1": "a", "2": "b"},
+            "intra_rack_ms": 0.5,
+            "inter_rack_ms": 10,
+            "links": {"0-2": 25}
+        }
+    Explicit links take precedence over the rack latencies, nodes without rack
+    are considered in their own rack.
+    """
+
+    def __init__(
+        self,
+        racks: Dict[int, str],
+        intra_rack: float = 0,
+        inter_rack: float = 0,
+        links: Optional[Dict[Tuple[int, int], float]] = None,
+    ) -> None:
+        self.racks = racks
+        self.intra_rack = intra_rack
+        self.inter_rack = inter_rack
+        self.links = links or {}
+
+    @classmethod
+    def from_file(cls, path: str) -> "LinkLatency":
+        with open(path) as file:
+            data = json.load(file)
+
+        links = {}
+        for link, ms in data.get("links", {}).items():
+            a, b = (int(x) for x in link.split("-"))
+            links[a, b] = links[b, a] = ms / 1000
+
+        return cls(
+            {int(k): v for k, v in data.get("racks", {}).items()},
+            data.get("intra_rack_ms", 0) / 1000,
+            data.get("inter_rack_ms", 0) / 1000,
+            links,
+        )
+
+    def rtt(self, a: Optional[int], b: int) -> float:
+        """
+        Seconds added to every call from node a to node b
+        """
+        if a is None or a == b:
+            return 0
+        if (a, b) in self.links:
+            return self.links[a, b]
+        if a in self.racks and self.racks[a] == self.racks.get(b):
+            return self.intra_rack
+        return self.inter_rack
+
+
+class DelayedProxy(Proxy):
+    """
+    Proxy that waits the synthetic link latency before every remote call
+    """
+
+    def __init__(self, uri: str, delay: float) -> None:
+        super().__init__(uri)
+        # Proxy.__setattr__ only accepts pyro attributes
+        object.__setattr__(self, "_delay", delay)
+
+    def _pyroInvoke(self, methodname, vargs, kwargs, flags=0, objectId=None):
+        time.sleep(self._delay)
+        return super()._pyroInvoke(methodname, vargs, kwargs, flags, objectId)
@@ -1,11 +1,17 @@
-from Pyro5.errors import PyroError
+from Pyro5.errors import NamingError, PyroError
 from dscraping.monitoring import echo_error
 from enum import Enum, auto
 import random
-from typing import Any, Set
-from Pyro5.api import Daemon, locate_ns, Proxy
+from typing import Any, Dict, Optional, Set, Tuple
+from Pyro5.api import Daemon, config, locate_ns, Proxy
 from Pyro5.nameserver import NameServer, NameServerDaemon
 
+from dscraping.latency import DelayedProxy, LinkLatency
+from dscraping.placement import KeyPlacement
+from dscraping.zmq_transport import SERVER_WORKERS, ZmqClient, ZmqProxy, ZmqServer
+
+TRANSPORTS = ("pyro", "zmq")
+
 
 class NodeType(Enum):
     none = auto()
@@ -18,25 +24,78 @@ class Node:
     _id: int
     _node_type: NodeType
 
+    # Nodes served by the same linker call each other directly instead of through a
+    # proxy, the proxy settings and calls made on the nodes they reach do nothing
+    _pyroTimeout: Optional[float] = None
+
+    def _pyroBind(self):
+        pass
+
+    def _pyroClaimOwnership(self):
+        pass
+
+    def _pyroRelease(self):
+        pass
+
 
 class Linker:
     """
     This class is an api to comunicate any member of the network with the resource server
     """
 
-    def __init__(self, m: int) -> None:
+    def __init__(
+        self,
+        m: int,
+        latency: Optional[LinkLatency] = None,
+        threadpool_size: Optional[int] = None,
+        transport: str = "pyro",
+        placement: Optional[KeyPlacement] = None,
+    ) -> None:
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown transport {transport}, use one of {TRANSPORTS}")
         self.BITS_COUNT = m
         self.MAX = 2 ** m
         self.name_server = locate_ns()
+        if threadpool_size is not None:
+            # Maximum number of requests served at the same time by the daemon
+            config.THREADPOOL_SIZE = threadpool_size
+            config.THREADPOOL_SIZE_MIN = min(config.THREADPOOL_SIZE_MIN, threadpool_size)
         self.daemon = Daemon()
         self.total_nodes = set(range(self.MAX))
+        # Position of the keys in the ring, the same in every node of the ring
+        self.placement = placement or KeyPlacement(m)
+
+        # Synthetic latency added to the calls from the local chord node to other chord nodes
+        self.latency = latency
+        self.local_id: Optional[int] = None
+        # Nodes served by the daemon of this linker, they are called directly
+        self.local_nodes: Dict[Tuple[NodeType, int], Node] = {}
+
+        # Chord nodes also serve and call each other over zmq with the zmq transport,
+        # nodes without zmq endpoint are still reached through pyro
+        self.transport = transport
+        self.threadpool_size = threadpool_size
+        self.zmq_servers: Dict[int, ZmqServer] = {}
+        self._zmq_client: Optional[ZmqClient] = None
+        self._zmq_endpoints: Dict[int, Optional[str]] = {}
 
     def register_node(self, node: "Node"):
+        if node._node_type == NodeType.chord:
+            self.local_id = node._id
         object_id = f"node.{node._node_type.name}.{node._id}"
         uri = self.daemon.register(node, object_id)
-        self.name_server.register(
-            object_id, uri, metadata=[f"node.{node._node_type.name}"]
-        )
+        self.local_nodes[node._node_type, node._id] = node
+        metadata = [f"node.{node._node_type.name}"]
+        if self.transport == "zmq" and node._node_type == NodeType.chord:
+            server = ZmqServer(
+                node,
+                lambda i: self.get_node(NodeType.chord, i),
+                self.threadpool_size or SERVER_WORKERS,
+            )
+            metadata.append(f"zmq:{server.bind(uri.host)}")
+            server.start()
+            self.zmq_servers[node._id] = server
+        self.name_server.register(object_id, uri, metadata=metadata)
         return uri
 
     def remove_node(self, node_type: "NodeType", node_id: int):
@@ -46,9 +105,72 @@ class Linker:
             # In case that name server Proxy is not owned by this thread
             ns = locate_ns()
             ns.remove(f"node.{node_type.name}.{node_id}")
-        self.daemon.shutdown()
-
-    def get_node(self, node_type: "NodeType", i: int) -> Proxy:
+        node = self.local_nodes.pop((node_type, node_id), None)
+        if node is not None:
+            self.daemon.unregister(node)
+        if node_type == NodeType.chord and node_id in self.zmq_servers:
+            self.zmq_servers.pop(node_id).stop()
+        # The daemon is shared by all the nodes of a host process
+        if not self.local_nodes:
+            self.daemon.shutdown()
+
+    @property
+    def zmq_client(self) -> ZmqClient:
+        if self._zmq_client is None:
+            self._zmq_client = ZmqClient(lambda i: self.get_node(NodeType.chord, i))
+        return self._zmq_client
+
+    def zmq_endpoint(self, i: int) -> Optional[str]:
+        """
+        Zmq endpoint of the chord node registered in the name server, it is cached
+        until a call to the node fails
+        """
+        if i not in self._zmq_endpoints:
+            name = self.node_uri(NodeType.chord, i).replace("PYRONAME:", "")
+            try:
+                _, metadata = self.name_server.lookup(name, return_metadata=True)
+            except NamingError:
+                # Not registered yet, the pyro proxy fails as usual when called
+                return None
+            except PyroError:
+                # In case that name server Proxy is not owned by this thread
+                _, metadata = locate_ns().lookup(name, return_metadata=True)
+            endpoints = [x[len("zmq:") :] for x in metadata if x.startswith("zmq:")]
+            self._zmq_endpoints[i] = endpoints[0] if endpoints else None
+        return self._zmq_endpoints[i]
+
+    def forget_zmq_endpoint(self, i: int):
+        self._zmq_endpoints.pop(i, None)
+
+    def local_node(self, node_type: "NodeType", i: int) -> Optional[Node]:
+        return self.local_nodes.get((node_type, i))
+
+    def get_node(self, node_type: "NodeType", i: int, source: Optional[int] = None) -> Any:
+        """
+        The node itself if it is served by this linker, otherwise a proxy to it.
+        The latency is the one from the source chord node, the local one by default.
+        """
+        node = self.local_node(node_type, i)
+        if node is not None:
+            return node
+
+        delay = 0
+        if self.latency is not None and node_type == NodeType.chord:
+            delay = self.latency.rtt(self.local_id if source is None else source, i)
+
+        if self.transport == "zmq" and node_type == NodeType.chord:
+            endpoint = self.zmq_endpoint(i)
+            if endpoint is not None:
+                return ZmqProxy(
+                    self.zmq_client,
+                    endpoint,
+                    i,
+                    delay,
+                    on_error=self.forget_zmq_endpoint,
+                )
+
+        if delay:
+            return DelayedProxy(self.node_uri(node_type, i), delay)
         return Proxy(self.node_uri(node_type, i))
 
     def get_nodes(self, node_type: "NodeType") -> Set[int]:
@@ -0,0 +1,88 @@
+import hashlib
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+PLACEMENTS = ("uniform", "host")
+
+
+def md5_int(value: str) -> int:
+    return int(hashlib.md5(value.encode()).hexdigest(), base=16)
+
+
+def url_host(url: str) -> str:
+    return urlsplit(url).hostname or url
+
+
+class KeyPlacement:
+    """
+    Position of the keys in the chord ring, the md5 of the whole key.
+    Keys are spread uniformly and the pages of a host can be at any position.
+    """
+
+    scheme = "uniform"
+
+    def __init__(self, m: int) -> None:
+        self.m = m
+        self.MAX = 2 ** m
+
+    @property
+    def info(self) -> Dict[str, Any]:
+        """
+        Settings of the placement, every node of a ring must use the same ones
+        """
+        return {"scheme": self.scheme}
+
+    def position(self, key: str) -> int:
+        return md5_int(key) % self.MAX
+
+    def host_arc(self, host: str) -> Tuple[int, int]:
+        """
+        First and last positions, clockwise, of the keys of the host
+        """
+        return 0, self.MAX - 1
+
+
+class HostPlacement(KeyPlacement):
+    """
+    Position of the keys given mainly by the host of the url. The hash of the host
+    is the start of an arc of 2 ** arc_bits positions, and the hash of the whole
+    url is the offset of the key in that arc:
+        position = (md5(host) + md5(url) % 2 ** arc_bits) % 2 ** m
+    The pages of a host are owned by the few nodes of its arc, and a wider arc
+    spreads the pages of big hosts across more nodes.
+    """
+
+    scheme = "host"
+
+    def __init__(self, m: int, arc_bits: Optional[int] = None) -> None:
+        super().__init__(m)
+        self.arc_bits = m // 2 if arc_bits is None else arc_bits
+        if not 0 <= self.arc_bits <= m:
+            raise ValueError(f"The arc bits must be between 0 and {m}")
+        self.arc_size = 2 ** self.arc_bits
+
+    @property
+    def info(self) -> Dict[str, Any]:
+        return {"scheme": self.scheme, "arc_bits": self.arc_bits}
+
+    def position(self, key: str) -> int:
+        start, _ = self.host_arc(url_host(key))
+        return (start + md5_int(key) % self.arc_size) % self.MAX
+
+    def host_arc(self, host: str) -> Tuple[int, int]:
+        start = md5_int(host) % self.MAX
+        return start, (start + self.arc_size - 1) % self.MAX
+
+
+def make_placement(
+    m: int, scheme: str = "uniform", arc_bits: Optional[int] = None
+) -> KeyPlacement:
+    if scheme == "uniform":
+        return KeyPlacement(m)
+    if scheme == "host":
+        return HostPlacement(m, arc_bits)
+    raise ValueError(f"Unknown placement {scheme}, use one of {PLACEMENTS}")
+
+
+def placement_from_info(m: int, info: Dict[str, Any]) -> KeyPlacement:
+    return make_placement(m, info["scheme"], info.get("arc_bits"))
@@ -0,0 +1,160 @@
+import gzip
+import io
+import json
+import os
+import zlib
+from typing import Any, Callable, Dict, Iterator, Optional, Set
+
+try:
+    import zstandard
+except ImportError:  # zstd output is optional
+    zstandard = None
+
+COMPRESSIONS = ("none", "gzip", "zstd")
+# Compression level of the gzip members, faster than the default of gzip
+GZIP_LEVEL = 6
+# Bytes read at once while looking for the end of the last complete record
+READ_SIZE = 1 << 20
+
+
+def compression_of(path: str) -> str:
+    if path.endswith(".gz"):
+        return "gzip"
+    if path.endswith(".zst"):
+        return "zstd"
+    return "none"
+
+
+def complete_length(path: str, decompressobj: Callable[[], Any]) -> int:
+    """
+    Bytes of the file up to the end of its last complete gzip member or zstd frame
+    """
+    length = offset = 0
+    decompressor = decompressobj()
+    with open(path, "rb") as file:
+        for data in iter(lambda: file.read(READ_SIZE), b""):
+            while data:
+                try:
+                    decompressor.decompress(data)
+                except Exception:
+                    # Garbage left by a crash while the member was written
+                    return length
+                if not decompressor.eof:
+                    offset += len(data)
+                    break
+                offset += len(data) - len(decompressor.unused_data)
+                length = offset
+                data = decompressor.unused_data
+                decompressor = decompressobj()
+    return length
+
+
+def read_records(path: str, compression: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Records of a result file, a record cut by a crash at the end is skipped
+    """
+    compression = compression_of(path) if compression is None else compression
+    with open(path, "rb") as file:
+        if compression == "gzip":
+            stream = gzip.GzipFile(fileobj=file)
+        elif compression == "zstd":
+            if zstandard is None:
+                raise RuntimeError("zstd output needs the zstandard package")
+            stream = zstandard.ZstdDecompressor().stream_reader(
+                file, read_across_frames=True
+            )
+        else:
+            stream = file
+        lines = io.TextIOWrapper(stream, encoding="utf-8")
+        try:
+            for line in lines:
+                if line.endswith("\n"):
+                    yield json.loads(line)
+        except (EOFError, OSError, zlib.error):
+            # The last gzip member is incomplete or garbage
+            return
+
+
+class ResultWriter:
+    """
+    Write the result of every url as a json line as soon as it is known:
+        {"url": ..., "body": ..., "error": ...}
+    Every line is flushed to the file, so a crash loses at most the results not
+    written yet and the lines already written stay readable.
+
+    Compressed lines are written each as its own gzip member or zstd frame, both
+    formats read consecutive members as a single stream. In append mode a record
+    cut by a crash is removed before writing the new ones, and the urls already
+    resolved by the previous records are kept in resolved.
+    """
+
+    def __init__(
+        self, path: str, compression: Optional[str] = None, append: bool = False
+    ) -> None:
+        self.path = path
+        self.compression = compression_of(path) if compression is None else compression
+        if self.compression not in COMPRESSIONS:
+            raise ValueError(
+                f"Unknown compression {self.compression}, use one of {COMPRESSIONS}"
+            )
+        if self.compression == "zstd":
+            if zstandard is None:
+                raise RuntimeError("zstd output needs the zstandard package")
+            self._zstd = zstandard.ZstdCompressor(write_checksum=True)
+
+        # Urls with a body in the records found when appending
+        self.resolved: Set[str] = set()
+        if append and os.path.exists(path):
+            self._file = open(path, "r+b")
+            self._file.truncate(self.complete_length())
+            self._file.seek(0, os.SEEK_END)
+            self.resolved = {
+                x["url"]
+                for x in read_records(path, self.compression)
+                if x["body"] is not None
+            }
+        else:
+            self._file = open(path, "wb")
+
+    def complete_length(self) -> int:
+        if self.compression == "gzip":
+            return complete_length(self.path, lambda: zlib.decompressobj(wbits=31))
+        if self.compression == "zstd":
+            decompressor = zstandard.ZstdDecompressor()
+            return complete_length(self.path, decompressor.decompressobj)
+        # Up to the last end of line
+        size = os.path.getsize(self.path)
+        with open(self.path, "rb") as file:
+            while size > 0:
+                start = max(0, size - READ_SIZE)
+                file.seek(start)
+                end = file.read(size - start).rfind(b"\n")
+                if end != -1:
+                    return start + end + 1
+                size = start
+        return 0
+
+    def encode(self, line: str) -> bytes:
+        data = line.encode()
+        if self.compression == "gzip":
+            return gzip.compress(data, GZIP_LEVEL, mtime=0)
+        if self.compression == "zstd":
+            return self._zstd.compress(data)
+        return data
+
+    def write(
+        self, url: str, body: Optional[str], error: Optional[str] = None, **fields: Any
+    ):
+        record = {"url": url, "body": body, "error": error, **fields}
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        self._file.write(self.encode(line))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
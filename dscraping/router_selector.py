@@ -0,0 +1,81 @@
+import time
+from typing import Dict, List, Optional
+
+from Pyro5.errors import PyroError
+
+from .node import Linker, NodeType
+from .placement import md5_int, url_host
+
+# An affine router is kept while its expected wait is at most this many times
+# the expected wait of the least loaded router
+LOAD_SLACK = 2.0
+# Seconds a router load report is trusted before asking the router again
+LOAD_TTL = 2.0
+# Latency assumed for routers that have not served any request yet
+DEFAULT_LATENCY = 1.0
+
+
+class RouterSelector:
+    """
+    Choose the router that serves an url.
+
+    Routers are ranked per host with rendezvous hashing, so every page of a host goes
+    to the same router while the set of routers does not change. The first router in
+    that ranking is skipped only when it is clearly busier than the least loaded one.
+    """
+
+    def __init__(
+        self,
+        linker: Linker,
+        load_slack: float = LOAD_SLACK,
+        load_ttl: float = LOAD_TTL,
+    ) -> None:
+        self.linker = linker
+        self.load_slack = load_slack
+        self.load_ttl = load_ttl
+        self._loads: Dict[int, Dict[str, float]] = {}
+        self._loads_time = 0.0
+
+    @staticmethod
+    def affinity(host: str, router_id: int) -> int:
+        return md5_int(f"{host}@{router_id}")
+
+    @staticmethod
+    def cost(load: Dict[str, float]) -> float:
+        """
+        Expected time for a new request to be served by the router
+        """
+        pending = load["queue_depth"] + load["in_flight"] + 1
+        return pending * (load["latency"] or DEFAULT_LATENCY)
+
+    def loads(self) -> Dict[int, Dict[str, float]]:
+        if time.time() - self._loads_time < self.load_ttl:
+            return self._loads
+
+        loads = {}
+        for router_id in self.linker.get_nodes(NodeType.router):
+            try:
+                loads[router_id] = self.linker.get_node(NodeType.router, router_id).load
+            except PyroError:
+                # The router is unreachable, it will not be selected
+                continue
+
+        self._loads = loads
+        self._loads_time = time.time()
+        return loads
+
+    def ranking(self, url: str) -> List[int]:
+        host = url_host(url)
+        return sorted(self.loads(), key=lambda x: self.affinity(host, x), reverse=True)
+
+    def select(self, url: str) -> Optional[int]:
+        loads = self.loads()
+        if not loads:
+            return None
+
+        min_cost = min(self.cost(load) for load in loads.values())
+        for router_id in self.ranking(url):
+            if self.cost(loads[router_id]) <= min_cost * self.load_slack:
+                # Account for this request until the next load report
+                loads[router_id]["in_flight"] += 1
+                return router_id
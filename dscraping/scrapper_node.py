@@ -1,83 +1,317 @@
+import json
+import os
+import re
+import threading
 import time
-from multiprocessing import Process
+from concurrent.futures import ProcessPoolExecutor
+from email.utils import parsedate_to_datetime
+from multiprocessing import Process, Value
+from typing import Any, Dict, List, Optional
 
 import Pyro5.api
 import requests
 
+from .extraction import extract, extract_page_links
+from .monitoring import echo_error
 from .node import Linker, Node, NodeType
+from .work_queue import Priority, WorkQueue
 
-MAX_BUFFER = 4
+MAX_QUEUE_SIZE = 64
+WORKERS = os.cpu_count() or 1
+# Weight of the last request in the router latency moving average
+LATENCY_DECAY = 0.2
+# Seconds a page is fresh when the origin does not say otherwise
+DEFAULT_TTL = 3600
+# Max number of frontier urls taken from a chord node at once
+CRAWL_BATCH_SIZE = 16
+# Seconds to wait before asking again for frontier urls when there were none
+CRAWL_INTERVAL = 1
+# Characters of a body sent to a client in a single call
+CHUNK_SIZE = 64 * 1024
 
 
 @Pyro5.api.expose
 class RouterNode(Node):
     _node_type = NodeType.router
 
-    def __init__(self, linker: Linker) -> None:
-        self._buffer = []
-        self._full = False
+    def __init__(
+        self,
+        linker: Linker,
+        workers: int = WORKERS,
+        max_queue_size: int = MAX_QUEUE_SIZE,
+        default_ttl: float = DEFAULT_TTL,
+        use_extraction: bool = False,
+        crawl_batch_size: int = CRAWL_BATCH_SIZE,
+    ) -> None:
         self.linker = linker
         self._id = self._find_id()
+        self.workers = workers
+        self.default_ttl = default_ttl
+        self._queue = WorkQueue(max_queue_size)
+        self._processes: List[Process] = []
+
+        # Pages requested to the daemon are parsed in this pool,
+        # the worker processes parse their own pages
+        self.use_extraction = use_extraction
+        self._parser_pool = ProcessPoolExecutor() if use_extraction else None
+
+        self.crawl_batch_size = crawl_batch_size
+        self._stopped = threading.Event()
+
+        # Shared with the worker processes, so the daemon can report their load
+        self._in_flight = Value("i", 0)
+        self._latency = Value("d", 0.0)
 
     @property
-    def buffer(self):
-        return self._buffer
+    def queue_depth(self):
+        return self._queue.depth
 
     @property
     def full(self):
-        return self._full
+        return self._queue.full
 
     @property
-    def id(self):
-        return self._id
+    def in_flight(self):
+        return self._in_flight.value
+
+    @property
+    def latency(self):
+        return self._latency.value
 
-    def set_full(self, value):
-        self._full = value
+    @property
+    def load(self) -> Dict[str, float]:
+        return {
+            "id": self.id,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "latency": self.latency,
+        }
 
-    def add_to_buffer(self, value):
-        self._buffer.append(value)
+    @property
+    def id(self):
+        return self._id
 
     def _find_id(self) -> int:
         alive_nodes = self.linker.get_nodes(NodeType.router)
         max_id = max(alive_nodes) if alive_nodes else 0
         return max_id + 1
 
-    def register_url(self, url, client_id):
-        self.add_to_buffer((url, client_id))
-        self.set_full(len(self.buffer) == MAX_BUFFER)
+    def register_url(
+        self,
+        url,
+        client_id,
+        priority: int = Priority.normal,
+        request: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        return self._queue.put((url, client_id, None, request), Priority(priority))
 
-    def request_scrapping(self, url, client_id):
-        if self.full:
+    def request_scrapping(
+        self,
+        url,
+        client_id,
+        request_id: int,
+        priority: int = Priority.normal,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ):
+        """
+        Queue the fetch of the url, the response is delivered to the client
+        with the request id as soon as it is ready
+        """
+        request = {"id": request_id, "etag": etag, "last_modified": last_modified}
+        if not self.register_url(url, client_id, priority, request):
             # the request cannot be taken, node is busy
             return (1, None)
-        self.register_url(url, client_id)
-        # the request has been buffered
+        # the request has been queued
         return (0, url)
 
-    def send_response(self, response, client_id):
+    def send_response(self, data: Dict[str, Any], client_id, request_id: int):
+        """
+        Deliver the body in chunks, the fetch metadata goes with the last one
+        """
         client = self.linker.get_node(NodeType.client, client_id)
-        client.set_response([response])
+        body = data["body"] or ""
+        chunks = [body[i : i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE)] or [""]
+        for i, chunk in enumerate(chunks[:-1]):
+            client.deliver(request_id, i, chunk)
+        client.deliver(
+            request_id,
+            len(chunks) - 1,
+            chunks[-1],
+            {k: v for k, v in data.items() if k != "body"},
+            data["body"] is None,
+        )
+
+    def send_error(self, message: str, client_id, request_id: int):
+        client = self.linker.get_node(NodeType.client, client_id)
+        client.fail(request_id, message)
 
     def main_loop(self):
+        self._parser_pool = None
         try:
             while True:
-                if self.buffer == []:
-                    time.sleep(1)
-                    continue
-                url, client_id = self.buffer.pop()
-                self.set_full(len(self.buffer) == MAX_BUFFER)
-                print(f"Procesing request from client {client_id}")
-                response = requests.get(url)
-                self.send_response(response, client_id)
+                _, item = self._queue.get()
+                if item is None:
+                    return
+                url, client_id, depth, request = item
+                try:
+                    if client_id is None:
+                        self.crawl(url, depth)
+                    else:
+                        print(f"Procesing request from client {client_id}")
+                        try:
+                            data = self.fetch(url, request["etag"], request["last_modified"])
+                            self.send_response(data, client_id, request["id"])
+                        except Exception as e:
+                            # The client waits until it gets the response or an error
+                            self.send_error(str(e), client_id, request["id"])
+                            raise
+                except Exception as e:
+                    # A failed item must not end the worker, failed crawls are dropped
+                    echo_error(str(e))
         except KeyboardInterrupt:
             return
 
     def scrap(self, url):
-        return requests.get(url).text
+        return self.fetch(url)["body"]
+
+    def crawl(self, url: str, depth: int):
+        """
+        Cache the page and add its links to the frontier if they must be followed
+        """
+        data = self.fetch(url)
+        node = self.linker.get_random_node(NodeType.chord)
+        if node is None:
+            raise LookupError("There are no chord nodes")
+        node.insert(url, data)
+        if depth > 0 and data["body"] is not None:
+            links = self.links(data, url)
+            if links:
+                node.add_to_frontier(links, depth - 1)
+
+    @staticmethod
+    def links(data: Dict[str, Any], url: str) -> List[str]:
+        if data["kind"] == "document":
+            return json.loads(data["body"])["links"]
+        return extract_page_links(data["body"], url)
+
+    def crawl_loop(self):
+        """
+        Move batches of frontier urls from the chord nodes to the router queue,
+        keeping half of the queue free for the client requests
+        """
+        while not self._stopped.is_set():
+            items = []
+            try:
+                free = self._queue.max_size // 2 - self._queue.depth
+                node = self.linker.get_random_node(NodeType.chord)
+                if free > 0 and node is not None:
+                    items = node.take_from_frontier(min(free, self.crawl_batch_size))
+                    rejected = [
+                        (url, depth)
+                        for url, depth in items
+                        if not self._queue.put((url, None, depth, None), Priority.low)
+                    ]
+                    if rejected:
+                        node.requeue_in_frontier(rejected)
+            except Exception as e:
+                echo_error(str(e))
+
+            if not items:
+                self._stopped.wait(CRAWL_INTERVAL)
+
+    def fetch(
+        self,
+        url: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Download the url and return the page with its fetch metadata.
+        If the validators of a cached copy are given the request is conditional,
+        and the returned body is None when the origin answers 304 Not Modified.
+        """
+        headers = {}
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        if last_modified is not None:
+            headers["If-Modified-Since"] = last_modified
+
+        with self._in_flight.get_lock():
+            self._in_flight.value += 1
+        start = time.time()
+        try:
+            response = requests.get(url, headers=headers)
+        finally:
+            self._record_request(time.time() - start)
+
+        if response.status_code == 304:
+            body, kind = None, None
+        elif self.use_extraction and "html" in response.headers.get("Content-Type", ""):
+            body, kind = self.extract(response.text, url), "document"
+        else:
+            body, kind = response.text, "html"
+
+        return {
+            "body": body,
+            "kind": kind,
+            "fetched_at": time.time(),
+            "ttl": self.ttl(response),
+            "etag": response.headers.get("ETag", etag),
+            "last_modified": response.headers.get("Last-Modified", last_modified),
+        }
+
+    def extract(self, html: str, url: str) -> str:
+        if self._parser_pool is None:
+            return extract(html, url)
+        return self._parser_pool.submit(extract, html, url).result()
+
+    def ttl(self, response: requests.Response) -> float:
+        """
+        Seconds the response stays fresh, from the Cache-Control and Expires headers
+        """
+        cache_control = response.headers.get("Cache-Control", "").lower()
+        if "no-store" in cache_control or "no-cache" in cache_control:
+            return 0
+        max_age = re.search(r"max-age=(\d+)", cache_control)
+        if max_age is not None:
+            return int(max_age.group(1))
+
+        expires = response.headers.get("Expires")
+        if expires is not None:
+            try:
+                return max(0, parsedate_to_datetime(expires).timestamp() - time.time())
+            except (TypeError, ValueError):
+                # An invalid date means the response is already expired
+                return 0
+
+        return self.default_ttl
+
+    def _record_request(self, elapsed: float):
+        with self._in_flight.get_lock():
+            self._in_flight.value -= 1
+        with self._latency.get_lock():
+            if self._latency.value == 0:
+                self._latency.value = elapsed
+            else:
+                self._latency.value += LATENCY_DECAY * (elapsed - self._latency.value)
 
     def start_loop(self):
-        p = Process(target=self.main_loop)
-        p.start()
-        self.linker.start_loop()
-        p.join()
-        self.linker.remove_node(self._node_type, self.id)
+        self._processes = [
+            Process(target=self.main_loop) for _ in range(self.workers)
+        ]
+        for p in self._processes:
+            p.start()
+        if self.crawl_batch_size > 0:
+            threading.Thread(target=self.crawl_loop, daemon=True).start()
+        try:
+            self.linker.start_loop()
+        finally:
+            self._stopped.set()
+            self._queue.stop(sum(p.is_alive() for p in self._processes))
+            for p in self._processes:
+                p.join()
+            self._queue.shutdown()
+            if self._parser_pool is not None:
+                self._parser_pool.shutdown()
+            self.linker.remove_node(self._node_type, self.id)
@@ -0,0 +1,51 @@
+import json
+import os
+from typing import Any, Dict, Optional
+
+from .monitoring import echo_warning
+
+# Seconds between two snapshots of a chord node
+SNAPSHOT_INTERVAL = 30
+
+
+def snapshot_path(directory: str, node_id: int) -> str:
+    return os.path.join(directory, f"node.chord.{node_id}.json")
+
+
+def save_snapshot(path: str, data: Dict[str, Any]):
+    """
+    Write the snapshot to a temporary file and move it over the previous one,
+    so a crash leaves either the old or the new snapshot but never a partial one
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(data, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def load_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        echo_warning(f"Ignoring unreadable snapshot {path}: {e}")
+        return None
+
+
+def remove_snapshot(path: str):
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,69 @@
+import itertools
+from enum import IntEnum
+from multiprocessing.managers import SyncManager
+from queue import Full, PriorityQueue
+from typing import Any, Optional, Tuple
+
+
+class Priority(IntEnum):
+    high = 0
+    normal = 1
+    low = 2
+
+
+class WorkQueueManager(SyncManager):
+    pass
+
+
+WorkQueueManager.register("PriorityQueue", PriorityQueue)
+
+
+class WorkQueue:
+    """
+    Bounded priority queue shared between the router daemon and its worker processes.
+    Items with lower priority value are served first, equal priorities in arrival order.
+    """
+
+    # Sort after every real priority, so workers drain the queue before they stop
+    _STOP = len(Priority)
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._manager = WorkQueueManager()
+        self._manager.start()
+        self._queue = self._manager.PriorityQueue(max_size)
+        self._counter = itertools.count()
+
+    def put(self, item: Any, priority: Priority = Priority.normal) -> bool:
+        """
+        Enqueue an item without blocking. Return False if the queue is full.
+        """
+        try:
+            self._queue.put_nowait((int(priority), next(self._counter), item))
+        except Full:
+            return False
+        return True
+
+    def get(self) -> Tuple[Optional[Priority], Any]:
+        """
+        Block until an item is available. Return (None, None) when the queue is stopped.
+        """
+        priority, _, item = self._queue.get()
+        if priority == self._STOP:
+            return None, None
+        return Priority(priority), item
+
+    def stop(self, workers: int):
+        for _ in range(workers):
+            self._queue.put((self._STOP, next(self._counter), None))
+
+    def shutdown(self):
+        self._manager.shutdown()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def full(self) -> bool:
+        return self._queue.full()
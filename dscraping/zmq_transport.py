@@ -0,0 +1,358 @@
+import builtins
+import functools
+import itertools
+import json
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from enum import Enum
+from queue import Empty, SimpleQueue
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import zmq
+from Pyro5.api import Proxy
+from Pyro5.errors import CommunicationError, PyroError
+
+# Seconds a call waits for its response before the node is considered unreachable
+REQUEST_TIMEOUT = 10.0
+# Threads of a server running the requested methods
+SERVER_WORKERS = 64
+
+
+class RemoteError(PyroError):
+    """
+    Exception raised by the remote method that has no builtin equivalent
+    """
+
+
+def encode(value: Any) -> bytes:
+    """
+    Serialize a message as json, nodes are sent as {"__node__": id} and
+    resolved to a proxy by the receiver
+    """
+
+    def default(x: Any) -> Any:
+        if isinstance(x, ZmqProxy):
+            return {"__node__": x._node_id}
+        if getattr(type(x), "_node_type", None) is not None or isinstance(x, Proxy):
+            return {"__node__": x.id}
+        if isinstance(x, Enum):
+            return x.value
+        if isinstance(x, (set, frozenset)):
+            return list(x)
+        raise TypeError(f"{type(x).__name__} is not serializable")
+
+    return json.dumps(value, default=default, separators=(",", ":")).encode()
+
+
+def decode(data: bytes, resolve_node: Callable[[int], Any]) -> Any:
+    def object_hook(x: Dict[str, Any]) -> Any:
+        if len(x) == 1 and "__node__" in x:
+            return resolve_node(x["__node__"])
+        return x
+
+    return json.loads(data, object_hook=object_hook)
+
+
+def decode_response(payload: bytes, resolve_node: Callable[[int], Any]) -> Any:
+    """
+    Return the result of a response or raise its error
+    """
+    response = decode(payload, resolve_node)
+    if "error" in response:
+        error = getattr(builtins, response["error"], None)
+        if not (isinstance(error, type) and issubclass(error, Exception)):
+            error = RemoteError
+        raise error(response["message"])
+    return response["result"]
+
+
+class _SocketLoop:
+    """
+    Thread owning zmq sockets. zmq sockets can not be shared between threads, other
+    threads put the messages to send in the outbox and wake the loop up through a
+    socket pair.
+    """
+
+    def __init__(self, context: Optional[zmq.Context] = None) -> None:
+        self.context = context or zmq.Context.instance()
+        self.poller = zmq.Poller()
+        self.outbox: "SimpleQueue[Tuple[Any, List[bytes]]]" = SimpleQueue()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self.poller.register(self._wakeup_r, zmq.POLLIN)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self.loop, daemon=True)
+
+    def send(self, target: Any, frames: List[bytes]):
+        self.outbox.put((target, frames))
+        self._wakeup_w.send(b"\0")
+
+    def loop(self):
+        while not self._stopped.is_set():
+            for sock, _ in self.poller.poll(1000):
+                # Plain sockets are polled by file descriptor
+                if sock == self._wakeup_r.fileno():
+                    try:
+                        while self._wakeup_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                else:
+                    self.on_message(sock, sock.recv_multipart())
+
+            while True:
+                try:
+                    target, frames = self.outbox.get_nowait()
+                except Empty:
+                    break
+                self.on_send(target, frames)
+
+    def on_message(self, sock: zmq.Socket, frames: List[bytes]):
+        raise NotImplementedError
+
+    def on_send(self, target: Any, frames: List[bytes]):
+        raise NotImplementedError
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup_w.send(b"\0")
+        self._thread.join()
+
+
+class ZmqServer(_SocketLoop):
+    """
+    Serve the public methods and properties of an object on a ROUTER socket.
+
+    Requests are [request id, json] frames multiplexed over the connection of every
+    client, they are run in a thread pool and answered as soon as each one finishes,
+    in any order.
+    """
+
+    def __init__(
+        self,
+        obj: Any,
+        resolve_node: Callable[[int], Any],
+        workers: int = SERVER_WORKERS,
+        context: Optional[zmq.Context] = None,
+    ) -> None:
+        super().__init__(context)
+        self.obj = obj
+        self.resolve_node = resolve_node
+        self.executor = ThreadPoolExecutor(workers)
+        self.socket = self.context.socket(zmq.ROUTER)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.poller.register(self.socket, zmq.POLLIN)
+        self.endpoint: Optional[str] = None
+
+    def bind(self, host: str) -> str:
+        port = self.socket.bind_to_random_port(f"tcp://{host}")
+        self.endpoint = f"tcp://{host}:{port}"
+        return self.endpoint
+
+    @functools.cached_property
+    def metadata(self) -> Dict[str, List[str]]:
+        cls = type(self.obj)
+        names = [x for x in dir(cls) if not x.startswith("_")]
+        return {
+            "attributes": [x for x in names if isinstance(getattr(cls, x), property)],
+            "methods": [x for x in names if callable(getattr(cls, x))],
+        }
+
+    def dispatch(self, request: Dict[str, Any]) -> Any:
+        name = request["method"]
+        if name == "__metadata__":
+            return self.metadata
+        if name in self.metadata["attributes"]:
+            return getattr(self.obj, name)
+        if name in self.metadata["methods"]:
+            return getattr(self.obj, name)(*request["args"], **request["kwargs"])
+        raise AttributeError(f"{type(self.obj).__name__} has no public member {name}")
+
+    def handle(self, identity: bytes, request_id: bytes, payload: bytes):
+        try:
+            response = {"result": self.dispatch(decode(payload, self.resolve_node))}
+            data = encode(response)
+        except Exception as e:
+            data = encode({"error": type(e).__name__, "message": str(e)})
+        self.send(identity, [request_id, data])
+
+    def on_message(self, sock: zmq.Socket, frames: List[bytes]):
+        identity, request_id, payload = frames
+        self.executor.submit(self.handle, identity, request_id, payload)
+
+    def on_send(self, identity: bytes, frames: List[bytes]):
+        self.socket.send_multipart([identity, *frames])
+
+    def stop(self):
+        super().stop()
+        self.executor.shutdown(wait=False)
+        self.socket.close()
+
+
+class ZmqClient(_SocketLoop):
+    """
+    Client of every ZmqServer reached by a process. There is a single persistent
+    DEALER socket per endpoint, concurrent calls are sent without waiting for the
+    previous ones and their responses are matched by request id.
+    """
+
+    def __init__(
+        self,
+        resolve_node: Callable[[int], Any],
+        timeout: float = REQUEST_TIMEOUT,
+        context: Optional[zmq.Context] = None,
+    ) -> None:
+        super().__init__(context)
+        self.resolve_node = resolve_node
+        self.timeout = timeout
+        self.sockets: Dict[str, zmq.Socket] = {}
+        self.pending: Dict[bytes, Future] = {}
+        self.metadata: Dict[str, Dict[str, List[str]]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.start()
+
+    def call_async(
+        self, endpoint: str, method: str, *args: Any, **kwargs: Any
+    ) -> "Future[bytes]":
+        """
+        Send the call and return the future of its raw response, see result
+        """
+        future: "Future[bytes]" = Future()
+        with self._lock:
+            request_id = next(self._ids).to_bytes(8, "little")
+            self.pending[request_id] = future
+        data = encode({"method": method, "args": args, "kwargs": kwargs})
+        self.send(endpoint, [request_id, data])
+        future.request_id = request_id
+        return future
+
+    def result(self, future: "Future[bytes]", timeout: Optional[float] = None) -> Any:
+        """
+        Wait for the response of a call and decode it in the calling thread,
+        resolving the nodes it contains may need the name server
+        """
+        try:
+            payload = future.result(self.timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self.pending.pop(future.request_id, None)
+            raise CommunicationError("zmq request timed out") from None
+
+        return decode_response(payload, self.resolve_node)
+
+    def call(
+        self,
+        endpoint: str,
+        method: str,
+        *args: Any,
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> Any:
+        return self.result(self.call_async(endpoint, method, *args, **kwargs), timeout)
+
+    def get_metadata(self, endpoint: str) -> Dict[str, List[str]]:
+        if endpoint not in self.metadata:
+            self.metadata[endpoint] = self.call(endpoint, "__metadata__")
+        return self.metadata[endpoint]
+
+    def on_send(self, endpoint: str, frames: List[bytes]):
+        if endpoint not in self.sockets:
+            sock = self.context.socket(zmq.DEALER)
+            sock.setsockopt(zmq.LINGER, 0)
+            sock.connect(endpoint)
+            self.poller.register(sock, zmq.POLLIN)
+            self.sockets[endpoint] = sock
+        self.sockets[endpoint].send_multipart(frames)
+
+    def on_message(self, sock: zmq.Socket, frames: List[bytes]):
+        request_id, payload = frames
+        with self._lock:
+            future = self.pending.pop(request_id, None)
+        # The future is missing if the caller gave up waiting
+        if future is not None:
+            future.set_result(payload)
+
+    def stop(self):
+        super().stop()
+        for sock in self.sockets.values():
+            sock.close()
+
+
+class ZmqProxy:
+    """
+    Proxy of a node served by a ZmqServer, with the interface of a Pyro proxy:
+    public properties are read remotely and public methods are called remotely
+    """
+
+    _pyroTimeout: Optional[float] = None
+
+    def __init__(
+        self,
+        client: ZmqClient,
+        endpoint: str,
+        node_id: int,
+        delay: float = 0,
+        on_error: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        self._client = client
+        self._endpoint = endpoint
+        self._node_id = node_id
+        self._delay = delay
+        self._on_error = on_error
+
+    def _unreachable(self):
+        # The node may be restarted on another endpoint
+        if self._on_error is not None:
+            self._on_error(self._node_id)
+
+    def _call(self, name: str, *args: Any, **kwargs: Any) -> Any:
+        if self._delay:
+            time.sleep(self._delay)
+        try:
+            return self._client.call(
+                self._endpoint, name, *args, timeout=self._pyroTimeout, **kwargs
+            )
+        except CommunicationError:
+            self._unreachable()
+            raise
+
+    def _call_async(self, name: str, *args: Any, **kwargs: Any) -> "Future[bytes]":
+        return self._client.call_async(self._endpoint, name, *args, **kwargs)
+
+    def _metadata(self) -> Dict[str, List[str]]:
+        try:
+            return self._client.get_metadata(self._endpoint)
+        except CommunicationError:
+            self._unreachable()
+            raise
+
+    def _pyroBind(self):
+        self._metadata()
+
+    def _pyroClaimOwnership(self):
+        # The client can be used from any thread
+        pass
+
+    def _pyroRelease(self):
+        # The socket of the endpoint is shared by all the proxies
+        pass
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        metadata = self._metadata()
+        if name in metadata["attributes"]:
+            return self._call(name)
+        if name in metadata["methods"]:
+            return functools.partial(self._call, name)
+        raise AttributeError(name)
+
+    def __repr__(self) -> str:
+        return f"<ZmqProxy node {self._node_id} at {self._endpoint}>"
@@ -1,11 +1,28 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
 import typer
+from Pyro5.api import Proxy
+from Pyro5.errors import PyroError
 from Pyro5.nameserver import start_ns
 
-from dscraping.chord_node import ChordNode
-from dscraping.client_node import ClientNode
-from dscraping.monitoring import echo
+from dscraping.chord_node import OPERATION_BUDGET, ChordNode
+from dscraping.latency import LinkLatency, percentile
+from dscraping.client_node import MAX_IN_FLIGHT, ClientNode
+from dscraping.monitoring import echo, echo_error
 from dscraping.node import Linker, NodeType
-from dscraping.scrapper_node import RouterNode
+from dscraping.placement import make_placement, placement_from_info
+from dscraping.snapshot import SNAPSHOT_INTERVAL
+from dscraping.scrapper_node import (
+    CRAWL_BATCH_SIZE,
+    DEFAULT_TTL,
+    MAX_QUEUE_SIZE,
+    WORKERS,
+    RouterNode,
+)
 
 app = typer.Typer()
 
@@ -14,39 +31,149 @@ CACHE_SIZE = 5
 HOST = "localhost"
 PORT = 9090
 
+# Nodes queried at the same time by the finger-table and hash-table commands
+ADMIN_WORKERS = 16
+ADMIN_PAGE_SIZE = 1000
+# Pages of keys of a node kept in memory before they are printed
+ADMIN_PREFETCH_PAGES = 2
+# Daemon threads of a chord node, every lookup hop keeps one busy while it waits
+THREADPOOL_SIZE = 128
 
-def echo_finger_table(node_id: int, linker: Linker):
-    node = linker.get_node(NodeType.chord, node_id)
-    ft = node.serialized_finger_table
 
-    echo(f"node.{NodeType(node.node_type).name}.{node.id} finger table =>")
-    for x in ft:
+def timed(f: Callable[[], Any]) -> Tuple[Any, float]:
+    start = time.time()
+    return f(), time.time() - start
+
+
+def echo_finger_table(info: Dict[str, Any]):
+    echo(f"node.{NodeType(info['node_type']).name}.{info['id']} finger table =>")
+    for x in info["finger_table"]:
         echo(f"\t{x}")
+    echo(f"\tsuccessors => {info['successors']}")
+    if info["suspected"]:
+        echo(f"\tsuspected => {info['suspected']}")
     echo()
 
 
-def echo_finger_tables(linker: Linker):
-    nodes = linker.get_nodes(NodeType.chord)
-    nodes = sorted(nodes)
-    for node_id in nodes:
-        echo_finger_table(node_id, linker)
+def query_nodes(
+    linker: Linker, node_ids: Iterable[int], query: Callable[[Any], Any]
+) -> Iterator[Any]:
+    """
+    Query the chord nodes in parallel and yield their answers in order of id,
+    the nodes that fail are printed with their error and skipped
+    """
+    node_ids = sorted(node_ids)
 
+    def call(node_id: int) -> Any:
+        try:
+            return query(linker.get_node(NodeType.chord, node_id))
+        except PyroError as e:
+            return e
 
-def echo_hash_table(node_id: int, linker: Linker):
-    node = linker.get_node(NodeType.chord, node_id)
-    ht = node.serialized_hash_table_keys
+    with ThreadPoolExecutor(ADMIN_WORKERS) as executor:
+        for node_id, result in zip(node_ids, executor.map(call, node_ids)):
+            if isinstance(result, PyroError):
+                echo_error(f"node.{NodeType.chord.name}.{node_id} => {result}")
+            else:
+                yield result
+
+
+def echo_finger_tables(linker: Linker, node_ids: Iterable[int]):
+    for info in query_nodes(linker, node_ids, lambda x: x.finger_table_info):
+        echo_finger_table(info)
 
-    echo(f"node.{NodeType(node.node_type).name}.{node.id} hash table keys =>")
-    for x in ht:
-        echo(f"\t{x}")
-    echo()
 
+def fetch_hash_table_pages(
+    linker: Linker, node_id: int, page_size: int, pages: "Queue[Optional[List[str]]]"
+):
+    try:
+        node = linker.get_node(NodeType.chord, node_id)
+        cursor = None
+        while True:
+            page = node.hash_table_keys_page(cursor, page_size)
+            pages.put(page["keys"])
+            cursor = page["next"]
+            if cursor is None:
+                break
+    except PyroError as e:
+        echo_error(f"node.{NodeType.chord.name}.{node_id} => {e}")
+    finally:
+        pages.put(None)
+
+
+def echo_hash_tables(linker: Linker, node_ids: Iterable[int], page_size: int):
+    """
+    Print the keys of the nodes in order while the next nodes are already queried.
+    Only a few pages per node are kept in memory.
+    """
+    node_ids = sorted(node_ids)
+    queues = {x: Queue(ADMIN_PREFETCH_PAGES) for x in node_ids}
+
+    with ThreadPoolExecutor(ADMIN_WORKERS) as executor:
+        for node_id in node_ids:
+            executor.submit(
+                fetch_hash_table_pages, linker, node_id, page_size, queues[node_id]
+            )
+
+        for node_id in node_ids:
+            echo(f"node.{NodeType.chord.name}.{node_id} hash table keys =>")
+            pages = queues[node_id]
+            for keys in iter(pages.get, None):
+                for x in keys:
+                    echo(f"\t{x}")
+            echo()
+
+
+def echo_summaries(linker: Linker, node_ids: Iterable[int]):
+    def percent(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value:.1%}"
+
+    summaries = list(query_nodes(linker, node_ids, lambda x: x.summary))
+
+    for x in summaries:
+        echo(
+            f"node.{NodeType(x['node_type']).name}.{x['id']} => "
+            f"{x['references']} keys, {x['bodies']} bodies, "
+            f"{x['physical_bytes']} bytes (dedup {x['dedup_ratio']:.2f}), "
+            f"hit rate {percent(x['hit_rate'])}, "
+            f"ownership {percent(x['ownership'])}, "
+            f"frontier {x['frontier']}"
+        )
+    echo(
+        f"total => {sum(x['references'] for x in summaries)} keys, "
+        f"{sum(x['physical_bytes'] for x in summaries)} bytes, "
+        f"{len(summaries)} nodes"
+    )
 
-def echo_hash_tables(linker: Linker):
-    nodes = linker.get_nodes(NodeType.chord)
-    nodes = sorted(nodes)
-    for node_id in nodes:
-        echo_hash_table(node_id, linker)
+
+def start_chord_node(linker: Linker, node_id: int, *args: Any, **kwargs: Any) -> ChordNode:
+    """
+    Create a chord node served by the linker and join it to the ring,
+    the arguments are the ones of ChordNode after the linker
+    """
+    echo(f"Node id => {node_id}")
+    anchor_node = linker.get_random_node(NodeType.chord)
+    if anchor_node is not None:
+        echo(f"Anchor node => {anchor_node.id}")
+        # Keys must be placed the same way in every node of the ring
+        if anchor_node.placement != linker.placement.info:
+            linker.placement = placement_from_info(M, anchor_node.placement)
+            echo(f"Using the placement of the ring => {linker.placement.info}")
+
+    node = ChordNode(node_id, linker, *args, **kwargs)
+    if node.restore():
+        echo(f"Restored node {node_id} from {node.snapshot_path}")
+    uri = linker.register_node(node)
+
+    echo(f"Uri => {uri}")
+
+    node.join(anchor_node)
+
+    if anchor_node is None:
+        echo(f"Created node {node_id}")
+    else:
+        echo(f"Created node {node_id} joined to node {anchor_node.id}")
+    return node
 
 
 @app.command()
@@ -67,26 +194,33 @@ def finger_table(
     linker = Linker(M)
 
     if id is None:
-        echo_finger_tables(linker)
+        echo_finger_tables(linker, linker.get_nodes(NodeType.chord))
     else:
-        id %= linker.MAX
-        echo_finger_table(id, linker)
+        echo_finger_tables(linker, [id % linker.MAX])
 
 
 @app.command()
 def hash_table(
     id: int = typer.Argument(
         None,
-        help="Node id of the desired finger table. If no node is provided then all finger tables will be printed.",
-    )
+        help="Node id of the desired hash table. If no node is provided then all hash tables will be printed.",
+    ),
+    summary: bool = typer.Option(
+        False,
+        help="Print per node counts, bytes, hit rate and ring ownership instead of the keys.",
+    ),
+    page_size: int = typer.Option(
+        ADMIN_PAGE_SIZE,
+        help="Number of keys requested to a node at once.",
+    ),
 ):
     linker = Linker(M)
 
-    if id is None:
-        echo_hash_tables(linker)
+    node_ids = linker.get_nodes(NodeType.chord) if id is None else [id % linker.MAX]
+    if summary:
+        echo_summaries(linker, node_ids)
     else:
-        id %= linker.MAX
-        echo_hash_table(id, linker)
+        echo_hash_tables(linker, node_ids, page_size)
 
 
 @app.command()
@@ -102,26 +236,269 @@ def create_chord_node(
     use_stabilization: bool = typer.Argument(
         True, help="Use periodical stabilization if True."
     ),
+    snapshot_dir: str = typer.Argument(
+        None,
+        help="Directory of the node snapshots. If provided the node is restored from its last snapshot.",
+    ),
+    snapshot_interval: float = typer.Argument(
+        SNAPSHOT_INTERVAL, help="Seconds between two snapshots of the node."
+    ),
+    latency_file: str = typer.Option(
+        None,
+        help="Json file with synthetic latencies between nodes, added to every call of this node.",
+    ),
+    threadpool_size: int = typer.Option(
+        THREADPOOL_SIZE, help="Maximum number of requests served at the same time."
+    ),
+    transport: str = typer.Option(
+        "pyro", help="Transport of the calls between chord nodes, pyro or zmq."
+    ),
+    operation_budget: float = typer.Option(
+        OPERATION_BUDGET, help="Seconds an operation has to complete, including all its hops."
+    ),
+    hedging: bool = typer.Option(
+        False, help="Also ask the next best node when a lookup hop is slower than usual."
+    ),
+    proximity: bool = typer.Option(
+        True,
+        help="Measure the round trip time to other nodes and route lookups through the closest ones.",
+    ),
+    placement: str = typer.Option(
+        "uniform",
+        help="Position of the keys in the ring, uniform or host to keep the pages of a host together. Nodes joining a ring use the placement of the ring.",
+    ),
+    host_arc_bits: int = typer.Option(
+        None,
+        help="With the host placement the pages of a host are spread over 2 ** bits positions. Half the ring bits by default.",
+    ),
 ):
-    linker = Linker(M)
+    latency = None if latency_file is None else LinkLatency.from_file(latency_file)
+    linker = Linker(
+        M, latency, threadpool_size, transport, make_placement(M, placement, host_arc_bits)
+    )
+
+    # Serve requests while joining, the ring may still route to a previous
+    # instance of this node if it was restarted
+    server = threading.Thread(target=linker.start_loop, daemon=True)
+    server.start()
 
     node_id = linker.get_aviable_chord_identifier() if id is None else id % linker.MAX
-    echo(f"Node id => {node_id}")
-    anchor_node = linker.get_random_node(NodeType.chord)
-    if anchor_node is not None:
-        echo(f"Anchor node => {anchor_node.id}")
+    start_chord_node(
+        linker,
+        node_id,
+        cache_size,
+        use_stabilization,
+        snapshot_dir=snapshot_dir,
+        snapshot_interval=snapshot_interval,
+        operation_budget=operation_budget,
+        use_hedging=hedging,
+        use_proximity=proximity,
+    )
+    server.join()
 
-    node = ChordNode(node_id, linker, cache_size, use_stabilization)
-    uri = linker.register_node(node)
 
-    echo(f"Uri => {uri}")
-    node.join(anchor_node)
+@app.command()
+def host_chord_nodes(
+    ids: List[int] = typer.Argument(
+        None,
+        help="Ids of the nodes served by this process. If no ids are provided, count random aviable identifiers will be assigned.",
+    ),
+    count: int = typer.Option(1, help="Number of nodes when no ids are provided."),
+    cache_size: int = typer.Option(10, help="The cache max size per node."),
+    use_stabilization: bool = typer.Option(True, help="Use periodical stabilization."),
+    snapshot_dir: str = typer.Option(
+        None,
+        help="Directory of the node snapshots. If provided the nodes are restored from their last snapshot.",
+    ),
+    snapshot_interval: float = typer.Option(
+        SNAPSHOT_INTERVAL, help="Seconds between two snapshots of every node."
+    ),
+    latency_file: str = typer.Option(
+        None,
+        help="Json file with synthetic latencies between nodes, added to the calls to nodes of other processes.",
+    ),
+    threadpool_size: int = typer.Option(
+        THREADPOOL_SIZE,
+        help="Maximum number of requests served at the same time by the process.",
+    ),
+    transport: str = typer.Option(
+        "pyro", help="Transport of the calls to chord nodes of other processes, pyro or zmq."
+    ),
+    operation_budget: float = typer.Option(
+        OPERATION_BUDGET, help="Seconds an operation has to complete, including all its hops."
+    ),
+    hedging: bool = typer.Option(
+        False, help="Also ask the next best node when a lookup hop is slower than usual."
+    ),
+    proximity: bool = typer.Option(
+        True,
+        help="Measure the round trip time to other nodes and route lookups through the closest ones.",
+    ),
+    placement: str = typer.Option(
+        "uniform", help="Position of the keys in the ring, uniform or host."
+    ),
+    host_arc_bits: int = typer.Option(
+        None,
+        help="With the host placement the pages of a host are spread over 2 ** bits positions.",
+    ),
+):
+    """
+    Run several chord nodes in this process. They share a daemon and the name
+    server connection, and the calls between them are direct method calls.
+    """
+    latency = None if latency_file is None else LinkLatency.from_file(latency_file)
+    linker = Linker(
+        M, latency, threadpool_size, transport, make_placement(M, placement, host_arc_bits)
+    )
 
-    if anchor_node is None:
-        echo(f"Created node {node_id}")
+    server = threading.Thread(target=linker.start_loop, daemon=True)
+    server.start()
+
+    if ids:
+        node_ids = list(dict.fromkeys(x % linker.MAX for x in ids))
     else:
-        echo(f"Created node {node_id} joined to node {anchor_node.id}")
-    node.start_loop()
+        node_ids = [None] * count
+    for node_id in node_ids:
+        if node_id is None:
+            node_id = linker.get_aviable_chord_identifier()
+        start_chord_node(
+            linker,
+            node_id,
+            cache_size,
+            use_stabilization,
+            snapshot_dir=snapshot_dir,
+            snapshot_interval=snapshot_interval,
+            operation_budget=operation_budget,
+            use_hedging=hedging,
+            use_proximity=proximity,
+        )
+    echo(f"Hosting nodes {sorted(x for _, x in linker.local_nodes)}")
+    # Ends when the last node is disconnected
+    server.join()
+
+
+@app.command()
+def bench_lookup(
+    count: int = typer.Argument(100, help="Lookups of random keys started in every node.")
+):
+    linker = Linker(M)
+    results = list(
+        query_nodes(
+            linker, linker.get_nodes(NodeType.chord), lambda x: x.benchmark_lookups(count)
+        )
+    )
+    latencies = sorted(x for result in results for x in result["latencies"])
+    if not latencies:
+        echo_error("There are no chord nodes")
+        return
+
+    def ms(p: float) -> float:
+        return percentile(latencies, p) * 1000
+
+    echo(
+        f"{len(latencies)} lookups => mean {sum(latencies) / len(latencies) * 1000:.2f} ms, "
+        f"p50 {ms(0.5):.2f} ms, p90 {ms(0.9):.2f} ms, p99 {ms(0.99):.2f} ms"
+    )
+    hedging = [x for x in results if x["hedging"]]
+    if hedging:
+        echo(
+            f"{sum(x['hedged_hops'] for x in hedging)} hops hedged by "
+            f"{len(hedging)} of {len(results)} nodes"
+        )
+
+
+def echo_latencies(name: str, latencies: List[float], elapsed: float):
+    latencies = sorted(latencies)
+
+    def ms(p: float) -> float:
+        return percentile(latencies, p) * 1000
+
+    echo(
+        f"{name} => {len(latencies) / elapsed:.0f} calls/s, "
+        f"mean {sum(latencies) / len(latencies) * 1000:.3f} ms, "
+        f"p50 {ms(0.5):.3f} ms, p99 {ms(0.99):.3f} ms"
+    )
+
+
+@app.command()
+def bench_transport(
+    id: int = typer.Argument(..., help="Chord node created with the zmq transport."),
+    count: int = typer.Argument(2000, help="Calls made with every transport."),
+    concurrency: int = typer.Option(32, help="Calls in flight at the same time."),
+):
+    """
+    Compare the latency and throughput of pyro and zmq calls to a chord node
+    """
+    linker = Linker(M, transport="zmq")
+    node_id = id % linker.MAX
+    if linker.zmq_endpoint(node_id) is None:
+        echo_error(f"Node {node_id} has no zmq endpoint")
+        return
+
+    def pyro_calls(n: int) -> List[float]:
+        # Pyro proxies can not be shared between threads
+        node = Proxy(linker.node_uri(NodeType.chord, node_id))
+        node._pyroBind()
+        latencies = []
+        for _ in range(n):
+            start = time.time()
+            node.ping()
+            latencies.append(time.time() - start)
+        return latencies
+
+    echo_latencies("pyro sequential", *timed(lambda: pyro_calls(count)))
+    with ThreadPoolExecutor(concurrency) as executor:
+        echo_latencies(
+            f"pyro {concurrency} threads",
+            *timed(
+                lambda: [
+                    x
+                    for xs in executor.map(pyro_calls, [count // concurrency] * concurrency)
+                    for x in xs
+                ]
+            ),
+        )
+
+    node = linker.get_node(NodeType.chord, node_id)
+    node._pyroBind()
+
+    def zmq_calls(window: int) -> List[float]:
+        # Keep window calls in flight over the single socket of the node
+        latencies = []
+        in_flight: "Queue[Any]" = Queue()
+        for i in range(count + window):
+            if i >= window:
+                start, future = in_flight.get()
+                linker.zmq_client.result(future)
+                latencies.append(time.time() - start)
+            if i < count:
+                in_flight.put((time.time(), node._call_async("ping")))
+        return latencies
+
+    echo_latencies("zmq sequential", *timed(lambda: zmq_calls(1)))
+    echo_latencies(f"zmq {concurrency} in flight", *timed(lambda: zmq_calls(concurrency)))
+
+
+@app.command()
+def domain(
+    host: str = typer.Argument(..., help="Host of the cached pages, like example.com."),
+    bodies: bool = typer.Option(False, help="Also print the body of every page."),
+):
+    """
+    Print the cached pages of a host
+    """
+    linker = Linker(M)
+    node = linker.get_random_node(NodeType.chord)
+    if node is None:
+        echo_error("There are no chord nodes")
+        return
+
+    pages = node.get_domain(host)
+    echo(f"{host} => {len(pages)} cached pages")
+    for url in sorted(pages):
+        echo(f"\t{url} fetched at {time.ctime(pages[url]['fetched_at'])}")
+        if bodies:
+            echo(pages[url]["body"])
 
 
 @app.command()
@@ -145,9 +522,32 @@ def disconnect_chord_node(
 
 
 @app.command()
-def create_router_node():
+def create_router_node(
+    workers: int = typer.Argument(
+        WORKERS,
+        help="Number of worker processes serving the router queue.",
+    ),
+    max_queue_size: int = typer.Argument(
+        MAX_QUEUE_SIZE,
+        help="Max number of queued requests before the router rejects new ones.",
+    ),
+    default_ttl: float = typer.Argument(
+        DEFAULT_TTL,
+        help="Seconds a page stays fresh when the origin does not send cache headers.",
+    ),
+    use_extraction: bool = typer.Argument(
+        False,
+        help="Cache the title, text and links of the html pages instead of the raw html.",
+    ),
+    crawl_batch_size: int = typer.Argument(
+        CRAWL_BATCH_SIZE,
+        help="Max number of frontier urls taken at once from a chord node. 0 disables crawling.",
+    ),
+):
     linker = Linker(M)
-    node = RouterNode(linker)
+    node = RouterNode(
+        linker, workers, max_queue_size, default_ttl, use_extraction, crawl_batch_size
+    )
     uri = linker.register_node(node)
     echo(f"Created Router Node {node.id}.\nLocation: {uri}")
     node.start_loop()
@@ -158,12 +558,23 @@ def create_client_node(
     file: typer.FileText = typer.Argument(
         None,
         help="File with the urls for this node to resolve.",
-    )
+    ),
+    output: str = typer.Option(
+        None,
+        help="Json lines file of the results, compressed if it ends in .gz or .zst. output.client.<id>.jsonl by default.",
+    ),
+    append: bool = typer.Option(
+        False, help="Add the results to the output file instead of replacing it."
+    ),
+    max_in_flight: int = typer.Option(
+        MAX_IN_FLIGHT, help="Requests waiting for their response at the same time."
+    ),
 ):
-    lines = [line if line[-1] != "\n" else line[:-1] for line in file.readlines()]
+    # The file is read while the urls are resolved
+    lines = (line.strip() for line in file if line.strip())
 
     linker = Linker(M)
-    node = ClientNode(linker, lines)
+    node = ClientNode(linker, lines, output, append, max_in_flight)
     echo(f"Client Node id => {node.id}")
     uri = linker.register_node(node)
     echo(f"Uri => {uri}")
@@ -171,6 +582,28 @@ def create_client_node(
     node.start_loop()
 
 
+@app.command()
+def crawl(
+    file: typer.FileText = typer.Argument(
+        None,
+        help="File with the seed urls of the crawl.",
+    ),
+    depth: int = typer.Argument(
+        1,
+        help="Number of link levels followed from the seed urls.",
+    ),
+):
+    linker = Linker(M)
+    node = linker.get_random_node(NodeType.chord)
+    if node is None:
+        echo("There are no chord nodes to hold the crawl frontier")
+        return
+
+    seeds = [line.strip() for line in file if line.strip()]
+    count = node.add_to_frontier(seeds, depth)
+    echo(f"Queued {count} new seed urls of {len(seeds)} with depth {depth}")
+
+
 @app.command()
 def scrap(url: str = typer.Argument(None, help="Url to be scrapped")):
     linker = Linker(M)
@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+from dscraping.aio_client import AsyncDHTClient
+
+
+def test_concurrent_operations_share_a_ring_refresh():
+    async def run() -> int:
+        client = AsyncDHTClient(3, ring_ttl=10)
+        refreshes = 0
+
+        async def refresh_ring():
+            nonlocal refreshes
+            refreshes += 1
+            await asyncio.sleep(0.01)
+            client.node_ids = [1]
+            client._ring_time = time.time()
+
+        client.refresh_ring = refresh_ring
+        await asyncio.gather(*(client.maybe_refresh_ring() for _ in range(100)))
+        # The operations that see an expired ring refresh it once more
+        client._ring_time = 0.0
+        await asyncio.gather(*(client.maybe_refresh_ring() for _ in range(100)))
+        client.context.term()
+        return refreshes
+
+    assert asyncio.run(run()) == 2
+
+
+def test_operations_send_the_time_left_as_budget():
+    async def run() -> list:
+        client = AsyncDHTClient(3)
+        client.node_ids = [1]
+        client._ring_time = time.time()
+        calls = []
+
+        async def call(node_id, method, *args, **kwargs):
+            calls.append((node_id, method, args, kwargs["budget"]))
+
+        client.call = call
+        await client.insert("a", {"body": "x"}, timeout=2)
+        await client.get("a", timeout=1)
+        client.context.term()
+        return calls
+
+    (insert, get) = asyncio.run(run())
+    assert insert[:3] == (1, "insert", ("a", {"body": "x"}))
+    assert 1.5 < insert[3] <= 2
+    assert get[:3] == (1, "get", ("a",))
+    assert 0.5 < get[3] <= 1
@@ -0,0 +1,165 @@
+from dscraping.bloom_filter import BloomFilter, KeySummaries
+from dscraping.node import NodeType
+
+
+class FakeNode:
+    def __init__(self) -> None:
+        self.summary = BloomFilter.for_capacity(100)
+        self.readers = set()
+
+    def key_summary_delta(self, epoch, version, reader_id=None):
+        self.readers.add(reader_id)
+        return self.summary.delta(epoch, version)
+
+
+class FakeLinker:
+    def __init__(self, nodes) -> None:
+        self.nodes = nodes
+
+    def get_nodes(self, node_type):
+        assert node_type == NodeType.chord
+        return set(self.nodes)
+
+    def get_node(self, node_type, node_id, source=None):
+        return self.nodes[node_id]
+
+
+def test_added_keys_are_contained():
+    bloom_filter = BloomFilter.for_capacity(100)
+    for i in range(100):
+        bloom_filter.add(f"key{i}")
+
+    assert all(f"key{i}" in bloom_filter for i in range(100))
+    assert bloom_filter.version == len(set(bloom_filter.log))
+
+
+def test_delta_of_same_epoch_sends_new_positions():
+    bloom_filter = BloomFilter.for_capacity(100)
+    bloom_filter.add("a")
+    copy = BloomFilter.from_delta(bloom_filter.delta(None, 0))
+    bloom_filter.add("b")
+
+    delta = bloom_filter.delta(copy.epoch, copy.version)
+    assert "bits" not in delta
+    assert delta["positions"] == bloom_filter.log[copy.version :]
+    copy.apply(delta)
+    assert "b" in copy
+    assert copy.version == bloom_filter.version
+    assert copy.bits == bloom_filter.bits
+
+
+def test_delta_of_other_epoch_sends_all_bits():
+    bloom_filter = BloomFilter.for_capacity(100)
+    bloom_filter.add("a")
+    copy = BloomFilter.from_delta(bloom_filter.delta(None, 0))
+    rebuilt = BloomFilter(bloom_filter.size, bloom_filter.hashes)
+    rebuilt.add("b")
+
+    delta = rebuilt.delta(copy.epoch, copy.version)
+    assert "bits" in delta
+    copy = BloomFilter.from_delta(delta)
+    assert copy.epoch == rebuilt.epoch
+    assert "b" in copy
+    assert copy.version == rebuilt.version
+
+
+def test_marked_keys_do_not_change_the_version():
+    bloom_filter = BloomFilter.for_capacity(100)
+    copy = BloomFilter.from_delta(bloom_filter.delta(None, 0))
+    bloom_filter.add("a")
+    copy.mark("a")
+    assert "a" in copy
+    assert copy.version == 0
+
+    copy.apply(bloom_filter.delta(copy.epoch, copy.version))
+    assert copy.version == bloom_filter.version
+
+
+def test_summaries_rule_out_keys_of_no_node():
+    nodes = {1: FakeNode(), 2: FakeNode()}
+    nodes[1].summary.add("a")
+    summaries = KeySummaries(FakeLinker(nodes), local_id=0)
+
+    assert summaries.might_contain("b")
+    summaries.sync()
+    assert nodes[1].readers == {0}
+    assert summaries.might_contain("a")
+    assert not summaries.might_contain("b")
+
+
+def test_summaries_keep_pushed_keys():
+    nodes = {1: FakeNode()}
+    summaries = KeySummaries(FakeLinker(nodes), local_id=0)
+    summaries.sync()
+
+    nodes[1].summary.add("a")
+    summaries.add_keys(1, ["a"])
+    assert summaries.might_contain("a")
+    summaries.sync()
+    assert summaries.might_contain("a")
+    assert summaries.filters[1].version == nodes[1].summary.version
+
+
+def test_summaries_keep_keys_pushed_during_sync():
+    nodes = {1: FakeNode()}
+    summaries = KeySummaries(FakeLinker(nodes), local_id=0)
+    delta = nodes[1].key_summary_delta
+
+    def stored_after_delta(*args):
+        # The key is stored and pushed after the filter was pulled
+        data = delta(*args)
+        nodes[1].summary.add("a")
+        summaries.add_keys(1, ["a"])
+        return data
+
+    nodes[1].key_summary_delta = stored_after_delta
+    summaries.sync()
+    assert summaries.might_contain("a")
+
+
+def test_summaries_without_copy_of_a_node_rule_out_nothing():
+    nodes = {1: FakeNode()}
+    summaries = KeySummaries(FakeLinker(nodes), local_id=0)
+    summaries.sync()
+    assert not summaries.might_contain("a")
+
+    # A node that joined after the sync stores a key
+    summaries.add_keys(2, ["a"])
+    assert summaries.might_contain("b")
+    nodes[2] = FakeNode()
+    nodes[2].summary.add("a")
+    summaries.sync()
+    assert summaries.might_contain("a")
+    assert not summaries.might_contain("b")
+
+
+def test_forgotten_node_rules_out_nothing_until_next_sync():
+    nodes = {1: FakeNode()}
+    summaries = KeySummaries(FakeLinker(nodes), local_id=0)
+    summaries.sync()
+    assert not summaries.might_contain("a")
+
+    # The node joined again with a new filter, no copy of it is pushed its keys
+    nodes[1] = FakeNode()
+    nodes[1].summary.add("a")
+    summaries.forget(1)
+    assert summaries.might_contain("a")
+    summaries.sync()
+    assert summaries.might_contain("a")
+    assert not summaries.might_contain("b")
+
+
+def test_node_forgotten_during_sync_rules_out_nothing():
+    nodes = {1: FakeNode()}
+    summaries = KeySummaries(FakeLinker(nodes), local_id=0)
+    delta = nodes[1].key_summary_delta
+
+    def forgotten_after_delta(*args):
+        data = delta(*args)
+        summaries.forget(1)
+        return data
+
+    nodes[1].key_summary_delta = forgotten_after_delta
+    summaries.sync()
+    assert 1 not in summaries.filters
+    assert summaries.might_contain("a")
@@ -0,0 +1,35 @@
+import pytest
+
+from dscraping.content_store import ContentStore
+
+
+def test_body_is_stored_once_per_digest():
+    store = ContentStore()
+    digest = store.add("body")
+
+    assert store.add("body") == digest
+    assert store[digest] == "body"
+    assert store.stats == {
+        "bodies": 1,
+        "references": 2,
+        "logical_bytes": 8,
+        "physical_bytes": 4,
+        "dedup_ratio": 2.0,
+    }
+
+
+def test_body_is_removed_with_its_last_reference():
+    store = ContentStore()
+    digest = store.add("body")
+    store.acquire(digest)
+
+    store.release(digest)
+    assert digest in store
+    store.release(digest)
+    assert digest not in store
+    assert store.stats["dedup_ratio"] == 1.0
+
+
+def test_unknown_digest_can_not_be_acquired():
+    with pytest.raises(KeyError):
+        ContentStore().acquire("missing")
@@ -0,0 +1,36 @@
+from dscraping.failure_detector import FailureDetector
+
+
+def test_silent_node_is_suspected():
+    detector = FailureDetector(threshold=5.0, expected_interval=1.0)
+    for t in range(10):
+        detector.heartbeat(1, now=float(t))
+
+    assert detector.phi(1, now=9.5) < 1
+    assert detector.phi(1, now=30.0) > 5
+    assert detector.phi(2) == 0.0
+
+
+def test_failed_node_is_suspected_until_next_heartbeat():
+    detector = FailureDetector()
+    detector.heartbeat(1)
+    detector.fail(1)
+
+    assert detector.is_suspected(1)
+    assert detector.suspected == {1}
+    detector.heartbeat(1)
+    assert not detector.is_suspected(1)
+    assert not detector.is_suspected(None)
+
+
+def test_forgotten_nodes_are_not_suspected():
+    detector = FailureDetector()
+    detector.heartbeat(1)
+    detector.heartbeat(1)
+    detector.fail(2)
+
+    assert detector.nodes == {1, 2}
+    detector.forget([1, 2])
+    assert detector.nodes == set()
+    assert detector.suspected == set()
+    assert 1 not in detector.intervals
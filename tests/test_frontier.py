@@ -0,0 +1,49 @@
+from dscraping.frontier import Frontier
+
+
+def test_seen_urls_are_queued_once():
+    frontier = Frontier()
+    assert frontier.add(["a", "b", "a"], 1) == 2
+    assert frontier.add(["b", "c"], 2) == 1
+    assert len(frontier) == 3
+
+    frontier.take(3)
+    assert frontier.add(["a"], 1) == 0
+    assert len(frontier) == 0
+
+
+def test_deeper_urls_are_taken_first():
+    frontier = Frontier()
+    frontier.add(["a1", "a2"], 0)
+    frontier.add(["b1", "b2"], 2)
+    frontier.add(["c1"], 1)
+
+    assert frontier.take(3) == [("b1", 2), ("b2", 2), ("c1", 1)]
+    assert frontier.take(5) == [("a1", 0), ("a2", 0)]
+    assert frontier.levels == {}
+
+
+def test_requeued_urls_are_taken_again_first():
+    frontier = Frontier()
+    frontier.add(["a", "b"], 1)
+    taken = frontier.take(1)
+    frontier.requeue(taken)
+
+    assert frontier.take(2) == [("a", 1), ("b", 1)]
+
+
+def test_export_moves_seen_and_pending_urls():
+    frontier = Frontier()
+    frontier.add(["x/1", "y/1"], 1)
+    frontier.add(["x/2"], 0)
+    frontier.take(1)
+
+    data = frontier.export(lambda url: url.startswith("x/"))
+    assert sorted(data["seen"]) == ["x/1", "x/2"]
+    assert data["pending"] == [("x/2", 0)]
+    assert frontier.dump() == {"seen": ["y/1"], "pending": [("y/1", 1)]}
+
+    other = Frontier()
+    other.merge(data)
+    assert other.add(["x/1"], 1) == 0
+    assert other.take(5) == [("x/2", 0)]
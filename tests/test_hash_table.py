@@ -0,0 +1,166 @@
+import pytest
+
+from dscraping.hash_table import CacheEntry, HashTable
+
+
+def entry(body):
+    return CacheEntry(body=body, fetched_at=0.0)
+
+
+def test_shared_body_is_stored_once():
+    table = HashTable(10)
+    table["a"] = entry("x")
+    table["b"] = entry("x")
+
+    assert table.store.stats["bodies"] == 1
+    assert table.store.stats["references"] == 2
+    table.pop("a")
+    assert table.entry("b").body == "x"
+    table.pop("b")
+    assert table.store.stats["bodies"] == 0
+
+
+def test_overwrite_releases_old_body():
+    table = HashTable(10)
+    table["a"] = entry("x")
+    table["a"] = entry("y")
+
+    assert table.entry("a").body == "y"
+    assert list(table.store.bodies.values()) == ["y"]
+
+
+def test_eviction_releases_body():
+    table = HashTable(1)
+    table["a"] = entry("x")
+    table["b"] = entry("y")
+
+    assert "a" not in table
+    assert list(table.store.bodies.values()) == ["y"]
+
+
+def test_export_merge_skips_known_bodies():
+    sender = HashTable(10)
+    sender["a"] = entry("x")
+    sender["b"] = entry("y")
+    receiver = HashTable(10)
+    receiver["c"] = entry("x")
+
+    data = sender.export(["a", "b", "missing"], receiver.store.bodies)
+    assert set(data["entries"]) == {"a", "b"}
+    assert list(data["bodies"].values()) == ["y"]
+
+    receiver.merge(data)
+    assert receiver.entry("a").body == "x"
+    assert receiver.entry("b").body == "y"
+    assert receiver.store.stats["references"] == 3
+
+
+def test_pop_where_skips_known_entries():
+    sender = HashTable(10)
+    sender["a"] = entry("x")
+    sender["b"] = entry("y")
+    receiver = HashTable(10)
+    receiver["a"] = entry("x")
+
+    data = sender.pop_where(lambda key: True, receiver.digests(["a", "b"]))
+    assert list(data["entries"]) == ["b"]
+    assert len(sender) == 0
+    assert sender.store.stats["bodies"] == 0
+
+    receiver.merge(data)
+    assert receiver.entry("b").body == "y"
+
+
+def test_merge_overwrite_keeps_body_of_mirrored_key():
+    # The receiver has a -> x, the sender a -> y and b -> x. The body x is not
+    # sent, but overwriting a would release its last reference before b is added.
+    receiver = HashTable(10)
+    receiver["a"] = entry("x")
+    sender = HashTable(10)
+    sender["a"] = entry("y")
+    sender["b"] = entry("x")
+
+    data = sender.pop_where(lambda key: True, receiver.digests(["a", "b"]))
+    assert list(data["bodies"].values()) == ["y"]
+
+    receiver.merge(data)
+    assert receiver.entry("a").body == "y"
+    assert receiver.entry("b").body == "x"
+    assert receiver.store.stats["bodies"] == 2
+    assert receiver.store.stats["references"] == 2
+
+
+def test_merge_of_unknown_digest_changes_nothing():
+    sender = HashTable(10)
+    sender["a"] = entry("x")
+    sender["b"] = entry("y")
+    receiver = HashTable(10)
+    receiver["a"] = entry("z")
+
+    data = sender.export(["a", "b"], [sender.entry("b").digest])
+    with pytest.raises(KeyError):
+        receiver.merge(data)
+    assert receiver.entry("a").body == "z"
+    assert "b" not in receiver
+    assert receiver.store.stats["references"] == 1
+
+
+def test_summary_contains_added_keys():
+    table = HashTable(10)
+    table["a"] = entry("x")
+
+    assert "a" in table.summary
+    table.rebuild_summary()
+    assert "a" in table.summary
+
+
+def test_keys_after_pages_in_order_across_stripes():
+    table = HashTable(1000)
+    keys = [f"key{i:03}" for i in range(300)]
+    for key in reversed(keys):
+        table[key] = entry(key)
+    table.pop("key100")
+    table.pop_where(lambda x: x.endswith("7"))
+    expected = [x for x in keys if x != "key100" and not x.endswith("7")]
+
+    assert len(table.stripes) > 1
+    assert table.keys_after(None, 5) == expected[:5]
+    assert table.keys_after("key099", 3) == ["key101", "key102", "key103"]
+    paged, cursor = [], None
+    while True:
+        page = table.keys_after(cursor, 50)
+        if not page:
+            break
+        paged += page
+        cursor = page[-1]
+    assert paged == expected
+
+
+def test_evicted_keys_are_not_paged():
+    table = HashTable(2)
+    for key in ["c", "a", "b"]:
+        table[key] = entry(key)
+
+    assert table.keys_after(None, 10) == ["a", "b"]
+
+
+def test_refresh_replaces_the_entry():
+    table = HashTable(10)
+    table["a"] = entry("x")
+    old = table["a"]
+
+    assert table.refresh("a", fetched_at=5.0, ttl=10.0, etag="e")
+    assert not table.refresh("b", fetched_at=5.0)
+    assert table.get("a").body == "x"
+    assert (table["a"].fetched_at, table["a"].ttl, table["a"].etag) == (5.0, 10.0, "e")
+    assert (old.fetched_at, old.etag) == (0.0, None)
+    assert table.get("b") is None
+
+
+def test_entry_is_fresh_until_its_ttl():
+    assert CacheEntry(body="x", fetched_at=100.0).is_fresh(now=1e9)
+    stale = CacheEntry(body="x", fetched_at=100.0, ttl=10.0)
+    assert stale.expires_at == 110.0
+    assert stale.is_fresh(now=109.9)
+    assert not stale.is_fresh(now=110.0)
+    assert not CacheEntry(body="x", fetched_at=100.0, ttl=0).is_fresh(now=100.0)
@@ -0,0 +1,22 @@
+from dscraping.latency import LinkLatency, percentile
+
+
+def test_percentile_is_nearest_rank():
+    latencies = [float(x) for x in range(1, 101)]
+
+    assert percentile(latencies, 0) == 1
+    assert percentile(latencies, 0.5) == 51
+    assert percentile(latencies, 0.99) == 100
+    assert percentile(latencies, 1) == 100
+    assert percentile([3.0], 0.9) == 3
+
+
+def test_link_latency_prefers_explicit_links():
+    latency = LinkLatency({0: "a", 1: "a", 2: "b"}, 0.001, 0.01, {(0, 2): 0.05})
+
+    assert latency.rtt(0, 0) == 0
+    assert latency.rtt(None, 1) == 0
+    assert latency.rtt(0, 1) == 0.001
+    assert latency.rtt(1, 2) == 0.01
+    assert latency.rtt(0, 2) == 0.05
+    assert latency.rtt(0, 3) == 0.01
@@ -0,0 +1,47 @@
+import pytest
+
+from dscraping.placement import (
+    HostPlacement,
+    KeyPlacement,
+    make_placement,
+    placement_from_info,
+    url_host,
+)
+
+
+def test_url_host():
+    assert url_host("http://Example.com:8080/a?b=1") == "example.com"
+    assert url_host("not an url") == "not an url"
+
+
+def test_host_pages_stay_in_the_host_arc():
+    placement = HostPlacement(8, arc_bits=3)
+    start, end = placement.host_arc("example.com")
+
+    assert (end - start) % placement.MAX == 7
+    for i in range(50):
+        offset = (placement.position(f"http://example.com/p{i}") - start) % placement.MAX
+        assert offset < 8
+
+
+def test_uniform_arc_is_the_whole_ring():
+    placement = KeyPlacement(8)
+
+    assert placement.host_arc("example.com") == (0, 255)
+    assert 0 <= placement.position("http://example.com/") < 256
+
+
+def test_placement_info_round_trip():
+    placement = make_placement(8, "host", 2)
+    copy = placement_from_info(8, placement.info)
+
+    assert isinstance(copy, HostPlacement)
+    assert copy.arc_bits == 2
+    assert copy.position("http://a.com/x") == placement.position("http://a.com/x")
+
+
+def test_invalid_placements_are_rejected():
+    with pytest.raises(ValueError):
+        make_placement(8, "random")
+    with pytest.raises(ValueError):
+        HostPlacement(8, arc_bits=9)
@@ -0,0 +1,50 @@
+import pytest
+
+from dscraping.result_writer import ResultWriter, read_records
+
+
+@pytest.mark.parametrize("name", ["out.jsonl", "out.jsonl.gz"])
+def test_records_are_read_back(tmp_path, name):
+    path = str(tmp_path / name)
+    with ResultWriter(path) as writer:
+        writer.write("http://a/", "body a")
+        writer.write("http://b/", None, "No response")
+
+    assert list(read_records(path)) == [
+        {"url": "http://a/", "body": "body a", "error": None},
+        {"url": "http://b/", "body": None, "error": "No response"},
+    ]
+
+
+@pytest.mark.parametrize("name", ["out.jsonl", "out.jsonl.gz"])
+def test_append_removes_cut_record_and_keeps_resolved_urls(tmp_path, name):
+    path = str(tmp_path / name)
+    with ResultWriter(path) as writer:
+        writer.write("http://a/", "body a")
+        writer.write("http://b/", None, "No response")
+        writer.write("http://c/", "body c")
+    with open(path, "r+b") as file:
+        # A crash while the last record was written
+        file.truncate(file.seek(0, 2) - 5)
+
+    with ResultWriter(path, append=True) as writer:
+        assert writer.resolved == {"http://a/"}
+        writer.write("http://c/", "body c")
+
+    assert [x["url"] for x in read_records(path)] == ["http://a/", "http://b/", "http://c/"]
+
+
+def test_without_append_the_file_is_replaced(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    with ResultWriter(path) as writer:
+        writer.write("http://a/", "body a")
+    with ResultWriter(path) as writer:
+        assert writer.resolved == set()
+        writer.write("http://b/", "body b")
+
+    assert [x["url"] for x in read_records(path)] == ["http://b/"]
+
+
+def test_unknown_compression_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ResultWriter(str(tmp_path / "out.jsonl"), compression="brotli")
@@ -0,0 +1,63 @@
+from Pyro5.errors import CommunicationError
+
+from dscraping.node import NodeType
+from dscraping.router_selector import RouterSelector
+
+
+class FakeRouter:
+    def __init__(self, queue_depth=0, latency=0.1) -> None:
+        self.queue_depth = queue_depth
+        self.latency = latency
+
+    @property
+    def load(self):
+        if self.latency is None:
+            raise CommunicationError("unreachable")
+        return {"queue_depth": self.queue_depth, "in_flight": 0, "latency": self.latency}
+
+
+class FakeLinker:
+    def __init__(self, routers) -> None:
+        self.routers = routers
+
+    def get_nodes(self, node_type):
+        assert node_type == NodeType.router
+        return set(self.routers)
+
+    def get_node(self, node_type, node_id):
+        return self.routers[node_id]
+
+
+def test_pages_of_a_host_go_to_the_same_router():
+    selector = RouterSelector(FakeLinker({i: FakeRouter() for i in range(8)}), load_slack=100)
+    routers = {selector.select(f"http://a.com/{i}") for i in range(20)}
+    assert len(routers) == 1
+    assert routers == {selector.ranking("http://a.com/")[0]}
+    assert len({selector.select(f"http://host{i}.com/") for i in range(20)}) > 1
+
+
+def test_busy_affine_router_is_skipped_beyond_the_slack():
+    routers = {i: FakeRouter() for i in range(4)}
+    first, second = RouterSelector(FakeLinker(routers)).ranking("http://a.com/")[:2]
+
+    # Expected wait of 3 times the least loaded one, within a slack of 4
+    routers[first].queue_depth = 2
+    assert RouterSelector(FakeLinker(routers), load_slack=4).select("http://a.com/") == first
+    assert RouterSelector(FakeLinker(routers), load_slack=2).select("http://a.com/") == second
+
+
+def test_selected_router_counts_the_request_until_next_report():
+    routers = {1: FakeRouter(), 2: FakeRouter()}
+    selector = RouterSelector(FakeLinker(routers), load_slack=2, load_ttl=60)
+    first = selector.select("http://a.com/")
+    assert selector.loads()[first]["in_flight"] == 1
+    assert selector.select("http://a.com/") == first
+    # Two requests pending, the expected wait is 3 times the one of the other router
+    assert selector.select("http://a.com/") != first
+
+
+def test_unreachable_routers_are_not_selected():
+    assert RouterSelector(FakeLinker({})).select("http://a.com/") is None
+    routers = {1: FakeRouter(latency=None), 2: FakeRouter()}
+    selector = RouterSelector(FakeLinker(routers), load_slack=100)
+    assert {selector.select(f"http://host{i}.com/") for i in range(20)} == {2}
@@ -0,0 +1,40 @@
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+
+from dscraping.scrapper_node import RouterNode
+
+
+def router(default_ttl=60):
+    node = RouterNode.__new__(RouterNode)
+    node.default_ttl = default_ttl
+    return node
+
+
+def response(headers):
+    result = requests.Response()
+    result.headers.update(headers)
+    return result
+
+
+@pytest.mark.parametrize(
+    "headers, ttl",
+    [
+        ({}, 60),
+        ({"Cache-Control": "public, max-age=300"}, 300),
+        ({"Cache-Control": "No-Cache"}, 0),
+        ({"Cache-Control": "no-store, max-age=300"}, 0),
+        ({"Cache-Control": "max-age=300", "Expires": formatdate(0, usegmt=True)}, 300),
+        ({"Expires": formatdate(0, usegmt=True)}, 0),
+        ({"Expires": "not a date"}, 0),
+    ],
+)
+def test_ttl_follows_cache_headers(headers, ttl):
+    assert router().ttl(response(headers)) == ttl
+
+
+def test_ttl_of_future_expires():
+    expires = formatdate(time.time() + 120, usegmt=True)
+    assert 110 < router().ttl(response({"Expires": expires})) <= 120
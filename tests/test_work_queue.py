@@ -0,0 +1,43 @@
+import pytest
+
+from dscraping.work_queue import Priority, WorkQueue
+
+
+@pytest.fixture
+def queue():
+    queue = WorkQueue(4)
+    yield queue
+    queue.shutdown()
+
+
+def test_items_are_served_by_priority_then_arrival(queue):
+    queue.put("crawl", Priority.low)
+    queue.put("first", Priority.normal)
+    queue.put("urgent", Priority.high)
+    queue.put("second", Priority.normal)
+
+    assert [queue.get() for _ in range(4)] == [
+        (Priority.high, "urgent"),
+        (Priority.normal, "first"),
+        (Priority.normal, "second"),
+        (Priority.low, "crawl"),
+    ]
+
+
+def test_full_queue_rejects_items(queue):
+    assert all(queue.put(i) for i in range(4))
+    assert queue.full
+    assert not queue.put(4, Priority.high)
+    assert queue.depth == 4
+
+    queue.get()
+    assert queue.put(4)
+
+
+def test_workers_stop_after_the_queued_items(queue):
+    queue.put("a", Priority.low)
+    queue.stop(2)
+
+    assert queue.get() == (Priority.low, "a")
+    assert queue.get() == (None, None)
+    assert queue.get() == (None, None)